@@ -0,0 +1,173 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+# Janela (em meses do eixo) das médias móveis e da volatilidade
+ROLLING_WINDOW = 3
+
+# Colunas da tabela de indicadores por versão
+INDICATOR_COLUMNS = ['Mês', 'Preço', 'Var. Mensal', 'Var. Anual', 'Média Móvel', 'Volatilidade']
+
+
+def _last_filled(valores):
+    # Índice da última coluna preenchida de cada linha (-1 se nenhuma)
+    preenchido = ~np.isnan(valores)
+    if valores.shape[1] == 0:
+        return np.full(len(valores), -1)
+    return np.where(preenchido.any(axis=1), valores.shape[1] - 1 - preenchido[:, ::-1].argmax(axis=1), -1)
+
+
+def _window_sums(valores, janela):
+    # Somas em janelas móveis ao longo das colunas, por diferença de somas acumuladas
+    somas = np.cumsum(valores, axis=1, dtype='float64')
+    somas[:, janela:] -= somas[:, :-janela].copy()
+    return somas
+
+
+def _rolling(valores, janela, estatistica):
+    """Média (mín. 1 valor) ou desvio padrão amostral (mín. 2) em janela móvel, ignorando NaN."""
+    preenchido = ~np.isnan(valores)
+    zerado = np.where(preenchido, valores, 0)
+    quantidade = _window_sums(preenchido.astype('float64'), janela)
+    soma = _window_sums(zerado, janela)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if estatistica == 'mean':
+            return np.where(quantidade >= 1, soma / quantidade, np.nan)
+        quadrados = _window_sums(zerado * zerado, janela)
+        variancia = (quadrados - soma * soma / quantidade) / (quantidade - 1)
+        return np.where(quantidade >= 2, np.sqrt(np.maximum(variancia, 0)), np.nan)
+
+
+def _group_sums(valores, codigos, n_grupos):
+    # Soma das linhas de cada grupo: ordena por grupo e subtrai somas acumuladas nas bordas
+    # dos blocos (mais rápido que reduceat com milhares de grupos pequenos)
+    ordem = np.argsort(codigos, kind='stable')
+    acumulado = np.zeros((len(valores) + 1, valores.shape[1]))
+    np.cumsum(valores[ordem], axis=0, out=acumulado[1:])
+    bordas = np.searchsorted(codigos[ordem], np.arange(n_grupos + 1))
+    return acumulado[bordas[1:]] - acumulado[bordas[:-1]]
+
+
+class PriceAnalytics:
+    """Indicadores das séries calculados sob demanda sobre a matriz séries × meses.
+
+    Variação mensal (mês anterior do eixo), variação anual (mesmo mês do ano anterior),
+    média móvel e volatilidade (desvio padrão das variações mensais) na janela de
+    ROLLING_WINDOW meses. Nenhuma grade séries × meses fica guardada: os indicadores
+    saem só das linhas pedidas e os índices por segmento, de uma passada pela matriz
+    por nível de agregação (guardado só o resultado segmento × mês).
+    """
+
+    def __init__(self, matrix, janela=ROLLING_WINDOW):
+        self.matrix = matrix
+        self.janela = janela
+
+        # Mês equivalente do ano anterior: último mês do eixo no mesmo período (AAAA-MM) - 12, ou -1
+        periodos = matrix.meses.to_period('M').asi8
+        anterior = np.searchsorted(periodos, periodos - 12, side='right') - 1
+        existe = (anterior >= 0) & (periodos[np.maximum(anterior, 0)] == periodos - 12)
+        self._ano_anterior = np.where(existe, anterior, -1)
+
+        self._indices = {}
+        self._lock = threading.Lock()
+
+    def _variations(self, valores):
+        # Variações mensal e anual de cada célula; as colunas começam no primeiro mês do eixo
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mom = np.full(valores.shape, np.nan)
+            mom[:, 1:] = valores[:, 1:] / valores[:, :-1] - 1
+            anterior = self._ano_anterior[:valores.shape[1]]
+            existe = anterior >= 0
+            yoy = np.full(valores.shape, np.nan)
+            yoy[:, existe] = valores[:, existe] / valores[:, anterior[existe]] - 1
+        return mom, yoy
+
+    def segment_index(self, niveis):
+        """Índice de preços (base 100 no primeiro mês com preço) por segmento.
+
+        `niveis` são colunas de atributos (ex.: ['CATEGORIA', 'Marca']). A variação de
+        cada mês é a média geométrica das variações das versões com preço nos dois
+        meses (modelo pareado), então entradas e saídas de versões não distorcem o índice.
+        Retorna um DataFrame segmento × mês.
+        """
+        niveis = tuple(niveis)
+        with self._lock:
+            if niveis not in self._indices:
+                self._indices[niveis] = self._segment_index(niveis)
+            return self._indices[niveis]
+
+    def _segment_index(self, niveis):
+        grupos = self.matrix.atributos.groupby(list(niveis), sort=True, observed=True)
+        codigos = grupos.ngroup().to_numpy()
+        chaves = grupos.size().index
+        n_grupos, n_meses = len(chaves), len(self.matrix.meses)
+
+        # Séries sem segmento (atributo vazio) ficam fora de todos os índices
+        linhas = codigos >= 0
+        codigos = codigos[linhas]
+        valores = self.matrix.valores[linhas].astype('float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Log das variações mensais, só durante o cálculo deste nível
+            relativos = np.log(valores[:, 1:] / valores[:, :-1])
+        valido = ~np.isnan(relativos)
+        soma = _group_sums(np.where(valido, relativos, 0), codigos, n_grupos)
+        contagem = _group_sums(valido.astype('float64'), codigos, n_grupos)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            media = np.where(contagem > 0, soma / contagem, 0)
+
+        indice = 100 * np.exp(np.concatenate([np.zeros((n_grupos, 1)), np.cumsum(media, axis=1)], axis=1))
+
+        # Antes do primeiro mês com preço o segmento não existe
+        presenca = _group_sums((~np.isnan(valores)).astype('float64'), codigos, n_grupos) > 0
+        primeiro = np.where(presenca.any(axis=1), presenca.argmax(axis=1), n_meses)
+        indice[np.arange(n_meses)[None, :] < primeiro[:, None]] = np.nan
+        indice /= np.take_along_axis(indice, np.minimum(primeiro, n_meses - 1)[:, None], axis=1) / 100
+
+        return pd.DataFrame(indice, index=chaves, columns=self.matrix.meses)
+
+    def index_series(self, niveis, chave):
+        """Série mensal do índice de um segmento (ex.: ('E-SUV', 'BMW')), ou None se não existir."""
+        indices = self.segment_index(niveis)
+        chave = chave if len(niveis) > 1 else chave[0]
+        if chave not in indices.index:
+            return None
+        return indices.loc[chave]
+
+    def indicators(self, linhas, data_final=None):
+        """Indicadores de cada série em `linhas` no último mês com preço até data_final."""
+        colunas = self.matrix.month_window(None, data_final)
+        valores = self.matrix.valores[linhas, colunas].astype('float64')
+        ultimo = _last_filled(valores)
+        tem_preco = ultimo >= 0
+        posicoes = np.arange(len(self.matrix.atributos))[linhas][tem_preco]
+        meses = ultimo[tem_preco]
+
+        # Indicadores só das séries pedidas, até o mês final
+        valores = valores[tem_preco]
+        mom, yoy = self._variations(valores)
+        celulas = (np.arange(len(valores)), meses)
+
+        tabela = self.matrix.atributos.iloc[posicoes].reset_index(drop=True)
+        tabela['Mês'] = self.matrix.meses[meses]
+        tabela['Preço'] = valores[celulas]
+        tabela['Var. Mensal'] = mom[celulas]
+        tabela['Var. Anual'] = yoy[celulas]
+        tabela['Média Móvel'] = _rolling(valores, self.janela, 'mean')[celulas]
+        tabela['Volatilidade'] = _rolling(mom, self.janela, 'std')[celulas]
+        return tabela
+
+
+def rebase(indices, data_inicial=None, data_final=None):
+    """Recorta índices (segmento × mês) no período e rebaseia cada linha para 100 no início."""
+    dentro = np.ones(indices.shape[1], dtype=bool)
+    if data_inicial is not None:
+        dentro &= indices.columns >= pd.Timestamp(data_inicial)
+    if data_final is not None:
+        dentro &= indices.columns <= pd.Timestamp(data_final)
+    recorte = indices.loc[:, dentro]
+    if recorte.shape[1] == 0:
+        return recorte
+    # Base: primeiro valor de cada segmento dentro do período
+    return recorte.div(recorte.bfill(axis=1).iloc[:, 0], axis=0) * 100
@@ -0,0 +1,152 @@
+"""Geração em lote dos relatórios de todas as combinações Categoria/Marca/Modelo.
+
+Uso:
+    python batch_reports.py Data.XLSM --saida relatorios --formatos excel pdf ppt --processos 8
+
+A planilha é lida uma vez no processo principal (o que também aquece o cache
+Parquet); cada processo do pool carrega o cache e gera os relatórios das
+combinações que recebe. Ao final grava resumo.csv com o tempo e o erro (se
+houver) de cada relatório.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from charts import build_history_figure
+from dataset import get_dataset
+from reports import create_excel_report, create_pdf_report, create_ppt_report, image_renderer
+
+
+FORMATOS = {
+    'excel': ('xlsx', lambda dados, fig, matriz: create_excel_report(dados, None, {'Matriz por Versão': matriz})),
+    'pdf': ('pdf', lambda dados, fig, matriz: create_pdf_report(dados)),
+    'ppt': ('pptx', lambda dados, fig, matriz: create_ppt_report(dados, fig)),
+}
+
+# Dataset de cada processo do pool, carregado uma vez pelo inicializador
+_dataset = None
+
+
+def _init_worker(caminho_arquivo, aba_dados, aba_precos):
+    global _dataset
+    _dataset = get_dataset(caminho_arquivo, aba_dados, aba_precos)
+    # O paralelismo vem do pool: um único Chrome/aba de renderização por processo
+    image_renderer.workers = 1
+
+
+def _file_name(texto):
+    # Nomes de marca/modelo podem ter barras e outros caracteres inválidos em arquivos
+    return re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', str(texto)).strip(' .') or '_'
+
+
+def combinations(dataset):
+    """Todas as combinações (categoria, marca, modelo) presentes na planilha."""
+    indice = dataset.selection_index
+    return [(categoria, marca, modelo)
+            for categoria in indice.categorias()
+            for marca in indice.marcas(categoria)
+            for modelo in indice.modelos(categoria, marca)]
+
+
+def build_reports(combinacao, formatos, pasta_saida, incluir_inativos=False):
+    """Gera os relatórios de uma combinação; devolve uma linha de resumo por formato."""
+    categoria, marca, modelo = combinacao
+    pasta = os.path.join(pasta_saida, _file_name(categoria), _file_name(marca))
+    os.makedirs(pasta, exist_ok=True)
+
+    dados = _dataset.history(categoria, marca, modelo, incluir_inativos)
+    matriz = _dataset.version_matrix(categoria, marca, modelo, incluir_inativos) if 'excel' in formatos else None
+    fig = None
+    if 'ppt' in formatos:
+        fig = build_history_figure(dados, f"Histórico de Preço - {marca} {modelo} ({categoria})")
+
+    resumo = []
+    for formato in formatos:
+        extensao, gerar = FORMATOS[formato]
+        arquivo = os.path.join(pasta, f"relatorio_precos_{_file_name(categoria)}_{_file_name(modelo)}.{extensao}")
+        inicio = time.perf_counter()
+        erro = None
+        tamanho = 0
+        try:
+            conteudo = gerar(dados, fig, matriz)
+            with open(arquivo, 'wb') as f:
+                f.write(conteudo)
+            tamanho = len(conteudo)
+        except Exception as e:
+            erro = f"{type(e).__name__}: {e}"
+        resumo.append({
+            'categoria': categoria,
+            'marca': marca,
+            'modelo': modelo,
+            'formato': formato,
+            'linhas': len(dados),
+            'segundos': round(time.perf_counter() - inicio, 3),
+            'bytes': tamanho,
+            'arquivo': arquivo if erro is None else None,
+            'erro': erro,
+        })
+    return resumo
+
+
+def run_batch(caminho_arquivo, pasta_saida, formatos, processos=None, aba_dados='Data', aba_precos='Preco',
+              incluir_inativos=False):
+    """Gera os relatórios de todas as combinações num pool de processos; devolve o resumo."""
+    global _dataset
+    inicio = time.perf_counter()
+    _dataset = get_dataset(caminho_arquivo, aba_dados, aba_precos)
+    combinacoes = combinations(_dataset)
+    print(f"{len(combinacoes)} combinações carregadas em {time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+
+    resumo = []
+    with ProcessPoolExecutor(max_workers=processos, initializer=_init_worker,
+                             initargs=(caminho_arquivo, aba_dados, aba_precos)) as pool:
+        futuros = {pool.submit(build_reports, combinacao, formatos, pasta_saida, incluir_inativos): combinacao
+                   for combinacao in combinacoes}
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            categoria, marca, modelo = futuros[futuro]
+            try:
+                resumo.extend(futuro.result())
+            except Exception as e:
+                # Falha do processo (ex.: memória): registra para todos os formatos da combinação
+                resumo.extend({'categoria': categoria, 'marca': marca, 'modelo': modelo, 'formato': formato,
+                               'linhas': None, 'segundos': None, 'bytes': 0, 'arquivo': None,
+                               'erro': f"{type(e).__name__}: {e}"} for formato in formatos)
+            if concluidos % 50 == 0 or concluidos == len(futuros):
+                print(f"{concluidos}/{len(futuros)} combinações", file=sys.stderr)
+
+    resumo = pd.DataFrame(resumo)
+    os.makedirs(pasta_saida, exist_ok=True)
+    resumo.to_csv(os.path.join(pasta_saida, 'resumo.csv'), index=False)
+
+    falhas = resumo['erro'].notna().sum() if not resumo.empty else 0
+    print(f"{len(resumo) - falhas} relatórios gerados, {falhas} falha(s) em "
+          f"{time.perf_counter() - inicio:.1f}s", file=sys.stderr)
+    if not resumo.empty:
+        print(resumo.groupby('formato')['segundos'].agg(['count', 'sum', 'mean', 'max']).round(3).to_string(),
+              file=sys.stderr)
+    return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera os relatórios de todas as combinações Categoria/Marca/Modelo.")
+    parser.add_argument('planilha', nargs='?', default='Data.XLSM', help="planilha de origem (padrão: Data.XLSM)")
+    parser.add_argument('--saida', default='relatorios', help="pasta de saída (padrão: relatorios)")
+    parser.add_argument('--formatos', nargs='+', choices=sorted(FORMATOS), default=['excel', 'pdf', 'ppt'])
+    parser.add_argument('--processos', type=int, default=None, help="processos do pool (padrão: núcleos da máquina)")
+    parser.add_argument('--aba-dados', default='Data')
+    parser.add_argument('--aba-precos', default='Preco')
+    parser.add_argument('--incluir-inativos', action='store_true', help="inclui versões desativadas")
+    args = parser.parse_args(argv)
+
+    resumo = run_batch(args.planilha, args.saida, args.formatos, args.processos, args.aba_dados, args.aba_precos,
+                       args.incluir_inativos)
+    return 1 if not resumo.empty and resumo['erro'].notna().any() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
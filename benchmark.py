@@ -0,0 +1,347 @@
+"""Benchmark das etapas de carga, filtros, gráficos e relatórios com planilhas sintéticas.
+
+Uso:
+    python benchmark.py --tamanhos 1000x12 20000x60 200000x240 --repeticoes 3 --saida bench.json
+    python benchmark.py --comparar bench_antigo.json bench.json
+
+Cada tamanho VERSOESxMESES gera (uma vez, reaproveitada entre execuções) uma
+planilha com as abas Data e Preco no formato da Data.XLSM, a partir de uma
+semente fixa. Cada etapa roda --repeticoes vezes; o pico de memória é medido
+numa execução extra com tracemalloc (só alocações do Python/numpy, não as do
+pyarrow). O resultado vai para um JSON com a versão do código e do ambiente,
+e --comparar aponta as etapas que ficaram mais lentas entre dois arquivos.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from charts import build_comparison_figure, build_history_figure
+from dataset import (CACHE_DIR, PriceDataset, compact_dtypes, load_dataset, merge_price_history,
+                     read_workbook)
+from reports import create_excel_report, create_pdf_report, create_ppt_report
+
+
+TAMANHOS_PADRAO = ['1000x12', '5000x60', '20000x120']
+
+# Proporções da planilha sintética: versões por modelo, modelos por marca, categorias
+VERSOES_POR_MODELO = 6
+MODELOS_POR_MARCA = 8
+CATEGORIAS = ['A-SUV', 'B-SUV', 'C-SUV', 'D-SUV', 'E-SUV', 'B-HATCH', 'C-HATCH', 'B-SEDAN', 'C-SEDAN',
+              'D-SEDAN', 'PICK-UP', 'VAN']
+COMBUSTIVEIS = ['Flex', 'Gasolina', 'Diesel', 'Elétrico', 'Híbrido']
+
+# Células de preço gravadas como texto ("R$ 123.990,00"), como nas planilhas digitadas à mão
+FRACAO_TEXTO = 0.01
+SEPARADORES_BR = str.maketrans(',.', '.,')
+
+# Modelos sorteados para as etapas de filtro e gráfico
+AMOSTRA_MODELOS = 20
+AMOSTRA_GRAFICOS = 5
+COMPARADOS = 3
+
+ETAPAS = ['leitura', 'mesclagem', 'compactacao', 'carga_completa', 'carga_cache', 'estruturas', 'filtros',
+          'graficos', 'excel', 'pdf', 'ppt']
+
+
+def parse_size(texto):
+    """'20000x120' -> (20000, 120)."""
+    versoes, _, meses = texto.lower().partition('x')
+    return int(versoes), int(meses)
+
+
+def generate_workbook(caminho, versoes, meses, semente=0):
+    """Grava uma planilha sintética com as abas Data e Preco no formato da Data.XLSM.
+
+    As versões entram no mercado em meses sorteados, parte delas sai antes do fim
+    (status Inativo) e os preços mudam em degraus de R$ 1.000 terminados em 990.
+    """
+    rng = np.random.default_rng(semente)
+    n_modelos = max(1, versoes // VERSOES_POR_MODELO)
+    n_marcas = max(1, n_modelos // MODELOS_POR_MARCA)
+
+    modelo = rng.integers(0, n_modelos, versoes)
+    marca = modelo % n_marcas
+    categoria = np.array(CATEGORIAS)[(modelo * 7 + 3) % len(CATEGORIAS)]
+    combustivel = np.array(COMBUSTIVEIS)[rng.integers(0, len(COMBUSTIVEIS), versoes)]
+    motor = np.round(rng.choice([1.0, 1.3, 1.5, 1.6, 2.0, 2.8, 3.0], versoes), 1)
+
+    # Vida de cada versão no eixo de meses e trajetória de preço em degraus
+    inicio = rng.integers(0, max(1, meses // 2), versoes)
+    inativa = rng.random(versoes) < 0.15
+    fim = np.where(inativa, np.maximum(inicio + 1, rng.integers(meses // 2, meses + 1, versoes)), meses)
+    base = np.exp(rng.normal(np.log(150000), 0.5, versoes))
+    passos = rng.choice([0, 0, 0, 1, 1, 2, -1], (versoes, meses)) * 1000
+    precos = np.round((base[:, None] + np.cumsum(passos, axis=1)) / 1000) * 1000 - 10
+    precos = np.maximum(precos, 9990)
+    texto = rng.random((versoes, meses)) < FRACAO_TEXTO
+
+    primeiro_mes = pd.Timestamp('2025-01-01') - pd.DateOffset(months=meses - 1)
+    datas = pd.date_range(primeiro_mes, periods=meses, freq='MS')
+
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+    formato_data = workbook.add_format({'num_format': 'dd/mm/yyyy'})
+    try:
+        dados = workbook.add_worksheet('Data')
+        dados.write_row(0, 0, ['ID', 'Marca', 'Modelo', 'Motor', 'Versão', 'Combustível', 'Veículo', 'Status',
+                               'Segmento', 'ID'])
+        for i in range(versoes):
+            nome_marca = f"MARCA {marca[i]:03d}"
+            nome_modelo = f"MODELO {modelo[i]:05d}"
+            nome_versao = f"VERSAO {i:06d}"
+            dados.write_row(i + 1, 0, [
+                i + 1, nome_marca, nome_modelo, motor[i], nome_versao, combustivel[i],
+                f"{nome_marca} {nome_modelo} {motor[i]} {nome_versao} {combustivel[i]}", None, None, i + 1,
+            ])
+
+        preco = workbook.add_worksheet('Preco')
+        preco.write_row(0, 0, ['ID', 'STATUS', 'CATEGORIA'])
+        for j, data in enumerate(datas):
+            preco.write_datetime(0, 3 + j, data.to_pydatetime(), formato_data)
+        for i in range(versoes):
+            preco.write_row(i + 1, 0, [i + 1, 'Inativo' if inativa[i] else 'Ativo', categoria[i]])
+            valores = [float(valor) for valor in precos[i, inicio[i]:fim[i]]]
+            for j in np.flatnonzero(texto[i, inicio[i]:fim[i]]):
+                valores[j] = f"R$ {valores[j]:,.2f}".translate(SEPARADORES_BR)
+            preco.write_row(i + 1, 3 + int(inicio[i]), valores)
+    finally:
+        workbook.close()
+
+
+def _measure(funcao, repeticoes, memoria):
+    # Tempo de cada repetição e, opcionalmente, o pico de memória numa execução extra
+    tempos = []
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    resultado = {
+        'segundos': [round(t, 4) for t in tempos],
+        'min': round(min(tempos), 4),
+        'mediana': round(statistics.median(tempos), 4),
+    }
+    if memoria:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            funcao()
+            resultado['pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        finally:
+            tracemalloc.stop()
+    return resultado
+
+
+def _reset_cache(caminho):
+    shutil.rmtree(os.path.join(os.path.dirname(os.path.abspath(caminho)), CACHE_DIR), ignore_errors=True)
+
+
+def run_scenario(caminho, versoes, meses, repeticoes=3, formatos=('excel', 'pdf'), memoria=True, semente=0):
+    """Mede todas as etapas numa planilha; devolve o dicionário do cenário."""
+    etapas = {}
+
+    def medir(nome, funcao):
+        try:
+            etapas[nome] = _measure(funcao, repeticoes, memoria)
+        except Exception as e:
+            etapas[nome] = {'erro': f"{type(e).__name__}: {' '.join(str(e).split())}"}
+        print(f"  {nome}: {etapas[nome].get('mediana', etapas[nome].get('erro'))}", file=sys.stderr)
+
+    # Carga: leitura das abas (load_data), melt/merge e compactação de tipos
+    abas = ('Data', 'Preco')
+    sheets = {}
+    medir('leitura', lambda: sheets.update(read_workbook(caminho, abas)[0]))
+    mesclado = {}
+    medir('mesclagem', lambda: mesclado.update(zip(
+        ('base_preco', 'dados_mesclados'), merge_price_history(sheets['Data'], sheets['Preco']))))
+    medir('compactacao', lambda: [compact_dtypes(df) for df in
+                                  (sheets['Data'], mesclado['base_preco'], mesclado['dados_mesclados'])])
+
+    # Caminho do dashboard: carga sem cache (grava o Parquet) e carga pelo cache
+    def carga_completa():
+        _reset_cache(caminho)
+        return load_dataset(caminho, *abas)
+
+    medir('carga_completa', carga_completa)
+    bases = load_dataset(caminho, *abas)
+    medir('carga_cache', lambda: load_dataset(caminho, *abas))
+
+    def estruturas():
+        dataset = PriceDataset(*bases)
+        return dataset.selection_index, dataset.matrix, dataset.analytics, dataset.similarity
+
+    medir('estruturas', estruturas)
+    dataset = PriceDataset(*bases)
+
+    # Amostra fixa de modelos (mesma semente, mesmos modelos entre commits)
+    rng = np.random.default_rng(semente)
+    modelos = dataset.matrix.atributos[['CATEGORIA', 'Marca', 'Modelo']].drop_duplicates()
+    amostra = modelos.iloc[rng.permutation(len(modelos))[:AMOSTRA_MODELOS]].itertuples(index=False)
+    amostra = [tuple(modelo) for modelo in amostra]
+    inicio_periodo = dataset.meses[len(dataset.meses) // 2]
+    fim_periodo = dataset.meses[-1]
+
+    def comparados(categoria, marca, modelo):
+        outros = modelos[(modelos['CATEGORIA'] == categoria) & (modelos['Modelo'] != modelo)]
+        return [(m, mod) for _, m, mod in outros.head(COMPARADOS).itertuples(index=False)]
+
+    def filtros():
+        for categoria, marca, modelo in amostra:
+            dataset.history(categoria, marca, modelo)
+            dataset.latest(categoria, marca, modelo)
+            dataset.compare(categoria, (marca, modelo), comparados(categoria, marca, modelo),
+                            inicio_periodo, fim_periodo)
+
+    medir('filtros', filtros)
+
+    def graficos():
+        for categoria, marca, modelo in amostra[:AMOSTRA_GRAFICOS]:
+            build_history_figure(dataset.history(categoria, marca, modelo), f"{marca} {modelo}")
+            comparacao = dataset.compare(categoria, (marca, modelo), comparados(categoria, marca, modelo),
+                                         inicio_periodo, fim_periodo)
+            build_comparison_figure(comparacao.dados, f"{marca} {modelo}")
+
+    medir('graficos', graficos)
+
+    # Relatórios do modelo com mais linhas de histórico (pior caso da amostra)
+    categoria, marca, modelo = max(amostra, key=lambda chave: len(dataset.history(*chave)))
+    historico = dataset.history(categoria, marca, modelo)
+    comparacao = dataset.compare(categoria, (marca, modelo), comparados(categoria, marca, modelo),
+                                 inicio_periodo, fim_periodo)
+    tabela_comp = comparacao.ultimos[['Versão_Completa', 'MES', 'PRECO']].rename(
+        columns={'Versão_Completa': 'Versão', 'MES': 'Mês', 'PRECO': 'Preço'})
+    if 'excel' in formatos:
+        medir('excel', lambda: create_excel_report(historico, tabela_comp, {
+            'Matriz por Versão': dataset.version_matrix(categoria, marca, modelo)}))
+    if 'pdf' in formatos:
+        medir('pdf', lambda: create_pdf_report(historico, tabela_comp))
+    if 'ppt' in formatos:
+        fig = build_history_figure(historico, f"{marca} {modelo}")
+        medir('ppt', lambda: create_ppt_report(historico, fig))
+
+    return {
+        'versoes': versoes,
+        'meses': meses,
+        'linhas_historico': int(len(bases[2])),
+        'arquivo_bytes': os.path.getsize(caminho),
+        'modelo_relatorio': [categoria, marca, modelo],
+        'linhas_relatorio': int(len(historico)),
+        'etapas': etapas,
+        'rss_max_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'plataforma': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'nucleos': os.cpu_count(),
+    }
+
+
+def run_benchmark(tamanhos, pasta, repeticoes=3, formatos=('excel', 'pdf'), memoria=True, semente=0):
+    """Gera (ou reaproveita) as planilhas e mede cada tamanho; devolve o resultado completo."""
+    cenarios = []
+    for versoes, meses in tamanhos:
+        pasta_cenario = os.path.join(pasta, f"{versoes}x{meses}_s{semente}")
+        caminho = os.path.join(pasta_cenario, 'Data.xlsx')
+        geracao = None
+        if not os.path.isfile(caminho):
+            os.makedirs(pasta_cenario, exist_ok=True)
+            inicio = time.perf_counter()
+            generate_workbook(caminho, versoes, meses, semente)
+            geracao = round(time.perf_counter() - inicio, 2)
+        print(f"{versoes} versões x {meses} meses ({caminho})", file=sys.stderr)
+
+        cenario = run_scenario(caminho, versoes, meses, repeticoes, formatos, memoria, semente)
+        cenario['geracao_segundos'] = geracao
+        cenarios.append(cenario)
+    return {'ambiente': _environment(), 'repeticoes': repeticoes, 'semente': semente, 'cenarios': cenarios}
+
+
+def compare_results(antigo, novo, tolerancia=0.1, estatistica='min'):
+    """Tabela (cenário, etapa, tempo antigo/novo e razão) das etapas presentes nos dois resultados.
+
+    O padrão compara o menor tempo das repetições, o menos sensível a ruído da máquina.
+    """
+    linhas = []
+    anteriores = {(c['versoes'], c['meses']): c['etapas'] for c in antigo['cenarios']}
+    for cenario in novo['cenarios']:
+        etapas_antigas = anteriores.get((cenario['versoes'], cenario['meses']))
+        if etapas_antigas is None:
+            continue
+        for etapa in ETAPAS:
+            antes = etapas_antigas.get(etapa, {}).get(estatistica)
+            depois = cenario['etapas'].get(etapa, {}).get(estatistica)
+            if antes is None or depois is None:
+                continue
+            razao = depois / antes if antes > 0 else float('inf')
+            linhas.append({'cenario': f"{cenario['versoes']}x{cenario['meses']}", 'etapa': etapa,
+                           'antes': antes, 'depois': depois, 'razao': round(razao, 3),
+                           'regressao': razao > 1 + tolerancia})
+    return pd.DataFrame(linhas, columns=['cenario', 'etapa', 'antes', 'depois', 'razao', 'regressao'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do dashboard com planilhas sintéticas.")
+    parser.add_argument('--tamanhos', nargs='+', default=TAMANHOS_PADRAO,
+                        help="tamanhos VERSOESxMESES (padrão: %(default)s)")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--formatos', nargs='*', choices=['excel', 'pdf', 'ppt'], default=['excel', 'pdf'])
+    parser.add_argument('--pasta', default='.benchmark', help="pasta das planilhas sintéticas e do cache")
+    parser.add_argument('--saida', default=None, help="arquivo JSON do resultado (padrão: stdout)")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--sem-memoria', action='store_true', help="não mede o pico de memória (mais rápido)")
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTIGO', 'NOVO'),
+                        help="compara dois resultados em vez de medir")
+    parser.add_argument('--tolerancia', type=float, default=0.1,
+                        help="aumento relativo do tempo tratado como regressão (padrão: 0.1)")
+    parser.add_argument('--estatistica', choices=['min', 'mediana'], default='min',
+                        help="tempo comparado entre os resultados (padrão: min)")
+    args = parser.parse_args(argv)
+
+    if args.comparar:
+        with open(args.comparar[0], encoding='utf-8') as f:
+            antigo = json.load(f)
+        with open(args.comparar[1], encoding='utf-8') as f:
+            novo = json.load(f)
+        tabela = compare_results(antigo, novo, args.tolerancia, args.estatistica)
+        print(tabela.to_string(index=False))
+        return 1 if tabela['regressao'].any() else 0
+
+    resultado = run_benchmark([parse_size(t) for t in args.tamanhos], args.pasta, args.repeticoes,
+                              args.formatos, not args.sem_memoria, args.semente)
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
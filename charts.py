@@ -0,0 +1,179 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from lru import BoundedLRU
+
+
+# Acima deste total de pontos no gráfico as séries viram traces WebGL (Scattergl)
+WEBGL_POINTS = 2000
+
+# Orçamento de pontos por gráfico, dividido entre as séries, e limites por série;
+# séries mais longas que a sua parte são reduzidas com LTTB
+MAX_FIGURE_POINTS = 20000
+MAX_SERIES_POINTS = 500
+MIN_SERIES_POINTS = 60
+
+# Marcadores só em séries curtas (em séries longas eles dominam o desenho)
+MARKER_POINTS = 120
+
+PRICE_HOVER = "<b>%{fullData.name}</b><br>Mês: %{x|%d/%m/%Y}<br>Preço: R$ %{y:,.2f}<extra></extra>"
+INDEX_HOVER = "%{fullData.name}: %{y:.1f}<extra></extra>"
+
+
+def lttb(x, y, limite):
+    """Índices dos pontos mantidos pelo Largest-Triangle-Three-Buckets.
+
+    Reduz a série a `limite` pontos preservando picos e degraus: de cada bloco
+    fica o ponto que forma o maior triângulo com o ponto escolhido no bloco
+    anterior e a média do bloco seguinte. O primeiro e o último ponto sempre ficam.
+    """
+    n = len(x)
+    if limite >= n or limite < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    bordas = np.linspace(1, n - 1, limite - 1).astype('int64')
+    # Média de cada bloco (o "seguinte" do último bloco é o último ponto)
+    medias_x = np.append(np.add.reduceat(x[1:n - 1], bordas[:-1] - 1) / np.diff(bordas), x[-1])
+    medias_y = np.append(np.add.reduceat(y[1:n - 1], bordas[:-1] - 1) / np.diff(bordas), y[-1])
+
+    indices = np.empty(limite, dtype='int64')
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for bloco in range(limite - 2):
+        inicio, fim = bordas[bloco], bordas[bloco + 1]
+        mx, my = medias_x[bloco + 1], medias_y[bloco + 1]
+        areas = np.abs((x[anterior] - mx) * (y[inicio:fim] - y[anterior]) -
+                       (x[anterior] - x[inicio:fim]) * (my - y[anterior]))
+        anterior = inicio + int(areas.argmax())
+        indices[bloco + 1] = anterior
+    return indices
+
+
+def _numeric_axis(valores):
+    # Eixo x numérico para o LTTB (datas em nanossegundos)
+    if np.issubdtype(valores.dtype, np.datetime64):
+        return valores.astype('datetime64[ns]').astype('int64').astype('float64')
+    return valores.astype('float64')
+
+
+def _line_figure(dados, coluna_x, coluna_y, coluna_cor, titulo, hovertemplate):
+    # Uma linha por valor de coluna_cor (na ordem de aparição, como o px.line), com
+    # SVG ou WebGL conforme o total de pontos e séries longas reduzidas por LTTB.
+    # O hover usa só o nome da série e x/y: nenhum dado extra por ponto vai ao navegador
+    dados = dados[[coluna_x, coluna_y, coluna_cor]].dropna(subset=[coluna_x, coluna_y])
+    grupos = dados.groupby(coluna_cor, sort=False, observed=True).indices
+    limite = min(MAX_SERIES_POINTS, max(MIN_SERIES_POINTS, MAX_FIGURE_POINTS // max(len(grupos), 1)))
+    traco = go.Scattergl if len(dados) > WEBGL_POINTS else go.Scatter
+
+    eixo_x = dados[coluna_x].to_numpy()
+    eixo_y = dados[coluna_y].to_numpy(dtype='float64')
+    fig = go.Figure()
+    for nome, posicoes in grupos.items():
+        posicoes = posicoes[np.argsort(eixo_x[posicoes], kind='stable')]
+        x, y = eixo_x[posicoes], eixo_y[posicoes]
+        if len(x) > limite:
+            manter = lttb(_numeric_axis(x), y, limite)
+            x, y = x[manter], y[manter]
+        fig.add_trace(traco(
+            x=x, y=y, name=str(nome), legendgroup=str(nome),
+            mode='lines+markers' if len(x) <= MARKER_POINTS else 'lines',
+            hovertemplate=hovertemplate,
+        ))
+    fig.update_layout(title=titulo)
+    return fig
+
+
+def _apply_price_layout(fig):
+    fig.update_layout(
+        xaxis_title="Mês",
+        yaxis_title="Preço (R$)",
+        title_x=0.5,
+        legend_title="Versão",
+        hovermode="x unified",
+        legend=dict(
+            orientation="h",
+            yanchor="top",
+            y=-0.2,
+            xanchor="center",
+            x=0.5,
+        )
+    )
+
+    fig.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
+    return fig
+
+
+def build_history_figure(dados_filtrados, titulo):
+    # Gráfico de linha para histórico de preços (colunas já renomeadas para Mês/Preço)
+    fig = _line_figure(dados_filtrados, 'Mês', 'Preço', 'Versão', titulo, PRICE_HOVER)
+    return _apply_price_layout(fig)
+
+
+def build_comparison_figure(dados_combinados, titulo):
+    # Gráfico de comparação: uma linha por Marca + Modelo + Versão
+    fig = _line_figure(dados_combinados, 'MES', 'PRECO', 'Versão_Completa', titulo, PRICE_HOVER)
+    return _apply_price_layout(fig)
+
+
+def build_index_figure(dados_indices, titulo):
+    # Índices de preço (base 100) por segmento; colunas Mês, Índice e Série
+    fig = _line_figure(dados_indices, 'Mês', 'Índice', 'Série', titulo, INDEX_HOVER)
+    fig.update_layout(
+        xaxis_title="Mês",
+        yaxis_title="Índice (base 100)",
+        title_x=0.5,
+        legend_title="Segmento",
+        hovermode="x unified",
+        legend=dict(
+            orientation="h",
+            yanchor="top",
+            y=-0.2,
+            xanchor="center",
+            x=0.5,
+        )
+    )
+    return fig
+
+
+def figure_size(fig):
+    # Estimativa em bytes dos dados das séries (x, y, customdata), que dominam o payload
+    total = 0
+    for trace in fig.data:
+        for atributo in ('x', 'y', 'customdata'):
+            valores = getattr(trace, atributo, None)
+            if valores is not None:
+                total += 8 * getattr(valores, 'size', len(valores))
+    return total
+
+
+class FigureCache:
+    """Cache LRU de figuras Plotly, limitado por quantidade e por tamanho estimado.
+
+    Compartilhado entre sessões (o módulo sobrevive aos reruns do Streamlit); as
+    figuras devolvidas não devem ser alteradas por quem as recebe.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self._figuras = BoundedLRU(max_entries, max_bytes)
+
+    def get_or_build(self, key, builder):
+        # key=None desativa o cache (ex.: planilha remota, sem impressão digital)
+        if key is None:
+            return builder()
+
+        fig = self._figuras.get(key)
+        if fig is None:
+            fig = builder()
+            self._figuras.add(key, fig, figure_size(fig))
+        return fig
+
+    def clear(self):
+        self._figuras.clear()
+
+    def stats(self):
+        return self._figuras.stats()
+
+
+# Cache do processo, reaproveitado por todas as sessões do dashboard
+figure_cache = FigureCache()
@@ -0,0 +1,1235 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+from functools import cached_property
+from xml.etree import ElementTree
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from analytics import PriceAnalytics
+from instrumentation import span
+from similarity import SimilarityIndex
+
+
+# Versão do formato do cache em disco; incrementar invalida caches antigos
+CACHE_VERSION = 6
+CACHE_DIR = '.cache'
+# O cache guarda preços e histórico em partições por ano (AAAA); esta é a das linhas sem mês
+# (IDs sem nenhum preço)
+NO_MONTH_PARTITION = 'sem_mes'
+
+# Namespaces do workbook.xml, para localizar o arquivo de cada aba dentro do zip
+XLSX_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'rel': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+}
+
+# Colunas fixas da aba de preços; as demais são os meses
+PRICE_ID_COLUMNS = ['ID', 'STATUS', 'CATEGORIA']
+
+# Níveis dos filtros em cascata do dashboard
+SELECTION_LEVELS = ['CATEGORIA', 'Marca', 'Modelo', 'Versão']
+
+# Colunas da visão de último preço por versão; a chave inclui ID e STATUS porque a
+# planilha reaproveita IDs entre marcas e repete IDs ativos/inativos na aba Preco
+LATEST_KEY = SELECTION_LEVELS + ['ID', 'STATUS']
+LATEST_COLUMNS = LATEST_KEY + ['Combustível', 'MES', 'PRECO']
+
+# Colunas do histórico exibido e exportado nos relatórios (MES/PRECO renomeados)
+HISTORY_COLUMNS = ['ID', 'Marca', 'Modelo', 'Motor', 'Versão', 'Combustível', 'Veículo', 'MES', 'PRECO']
+
+# Colunas de atributos textuais dos veículos
+TEXT_COLUMNS = ['Marca', 'Modelo', 'Versão', 'Combustível', 'Veículo', 'STATUS', 'CATEGORIA']
+
+# Memo em processo: caminho -> (tamanho, mtime, sha256), evita re-hash a cada rerun
+_fingerprints = {}
+
+# Tempos (s) da última leitura completa da planilha, por etapa
+last_parse_timings = {}
+
+# Células de preço descartadas (não numéricas) na última carga, por aba
+last_rejected_prices = {}
+
+# Como foi a última carga: 'cache', 'incremental' (abas relidas, partições refeitas) ou 'completa'
+last_ingest = {}
+
+# Memória (bytes) de cada base antes/depois da compactação de tipos, na última carga
+last_memory_report = {}
+
+
+def convert_price_string(price_str):
+    if pd.isna(price_str):
+        return None
+    # Remove all periods except the last one (which is the decimal separator)
+    if isinstance(price_str, str):
+        parts = price_str.split('.')
+        if len(parts) > 1:
+            integer_part = ''.join(parts[:-1])
+            decimal_part = parts[-1]
+            price_str = f"{integer_part}.{decimal_part}"
+    return float(price_str)
+
+
+def normalize_prices(valores):
+    """Versão vetorizada de convert_price_string para uma coluna inteira.
+
+    Textos com vírgula seguem o padrão brasileiro ("R$ 1.234,56" → 1234.56). Só com
+    pontos vale a regra de convert_price_string: o último ponto é o decimal e os demais
+    são descartados ("1.234.56" → 1234.56, mas também "R$ 123.990" → 123.99 e
+    "1.234.567" → 1234.567); milhares sem centavos precisam vir com a vírgula
+    ("123.990,00") ou como número.
+    Retorna (Series float64, quantidade de células rejeitadas); valores que não
+    puderem ser convertidos viram NaN em vez de interromper a carga.
+    """
+    serie = pd.Series(valores)
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        return serie.astype('float64'), 0
+
+    # Preços se repetem muito entre meses/versões: converte só os valores distintos
+    codigos, distintos = pd.factorize(serie)
+    distintos = pd.Series(distintos, dtype=object)
+    convertidos = pd.to_numeric(distintos, errors='coerce').astype('float64')
+
+    pendentes = convertidos.isna()
+    if pendentes.any():
+        texto = distintos[pendentes].astype(str).str.replace(r'R\$|\s', '', regex=True)
+        com_virgula = texto.str.contains(',', regex=False)
+        # Padrão brasileiro: pontos são milhares e a vírgula é o decimal
+        texto_br = texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        # Só pontos: todos menos o último são separadores de milhar
+        texto_pontos = texto.str.replace(r'\.(?=.*\.)', '', regex=True)
+        convertidos[pendentes] = pd.to_numeric(texto_br.where(com_virgula, texto_pontos), errors='coerce')
+
+    # Código -1 = célula vazia: aponta para o NaN extra e não conta como rejeitada
+    precos = np.append(convertidos.to_numpy(), np.nan)[codigos]
+    rejeitados = int((np.isnan(precos) & (codigos >= 0)).sum())
+    return pd.Series(precos, index=serie.index, name=serie.name), rejeitados
+
+
+def normalize_price_columns(df, columns):
+    # Normaliza várias colunas de preço; retorna o total de células rejeitadas
+    rejeitados = 0
+    for coluna in columns:
+        df[coluna], n = normalize_prices(df[coluna])
+        rejeitados += n
+    return rejeitados
+
+
+def _clean_text_columns(df):
+    # Modelos/versões numéricos (ex.: 208, 2008) chegam como int no meio de strings;
+    # padroniza tudo como texto para concatenação e serialização em Parquet
+    for coluna in TEXT_COLUMNS:
+        if coluna in df.columns:
+            valores = df[coluna]
+            df[coluna] = valores.astype(str).where(valores.notna())
+    return df
+
+
+def _unique_columns(header):
+    # Mesma convenção do pandas para cabeçalhos repetidos/vazios: ID, ID.1, Unnamed: 3
+    colunas = []
+    vistos = {}
+    for posicao, nome in enumerate(header):
+        if nome is None:
+            nome = f"Unnamed: {posicao}"
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        colunas.append(nome)
+    return colunas
+
+
+def _rows_to_frame(rows):
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+
+    registros = list(rows)
+    # Descarta linhas vazias no fim da aba (formatação residual do Excel)
+    while registros and all(valor is None for valor in registros[-1]):
+        registros.pop()
+
+    df = pd.DataFrame.from_records(registros, columns=_unique_columns(header))
+
+    # Como o read_excel: colunas inteiramente numéricas gravadas como texto viram número
+    for coluna in df.columns:
+        if not pd.api.types.is_string_dtype(df[coluna].dtype):
+            continue
+        try:
+            df[coluna] = pd.to_numeric(df[coluna])
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+def _clean_sheet(df):
+    # Convert price column if it exists
+    if 'PRECO' in df.columns:
+        colunas_preco = ['PRECO']
+    elif set(PRICE_ID_COLUMNS).issubset(df.columns):
+        # Aba larga de preços: cada coluna além de ID/STATUS/CATEGORIA é um mês
+        colunas_preco = [coluna for coluna in df.columns if coluna not in PRICE_ID_COLUMNS]
+    else:
+        colunas_preco = []
+
+    df.attrs['precos_rejeitados'] = normalize_price_columns(df, colunas_preco)
+    return _clean_text_columns(df)
+
+
+def read_workbook(file_path, sheet_names):
+    """Lê as abas pedidas (todas, se None) numa única passada pelo arquivo.
+
+    Retorna ({aba: DataFrame}, {etapa: segundos}).
+    """
+    timings = {}
+    inicio = time.perf_counter()
+
+    if not os.path.isfile(file_path):
+        # Arquivos remotos: o pandas baixa uma vez e lê todas as abas
+        sheets = pd.read_excel(file_path, sheet_name=None if sheet_names is None else list(sheet_names))
+        sheet_names = list(sheets)
+        timings['read_excel'] = time.perf_counter() - inicio
+    else:
+        # Modo somente leitura + valores: linhas em streaming, sem o modelo de objetos
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True, keep_links=False)
+        timings['open'] = time.perf_counter() - inicio
+        try:
+            if sheet_names is None:
+                sheet_names = workbook.sheetnames
+            sheets = {}
+            for nome in sheet_names:
+                etapa = time.perf_counter()
+                aba = workbook[nome]
+                # A dimensão gravada no arquivo (<dimension ref=...>) pode estar desatualizada
+                # (ex.: "A1" em arquivos gerados por outras ferramentas) e cortaria as linhas
+                aba.reset_dimensions()
+                sheets[nome] = _rows_to_frame(aba.iter_rows(values_only=True))
+                timings[nome] = time.perf_counter() - etapa
+        finally:
+            workbook.close()
+
+    etapa = time.perf_counter()
+    for nome in sheet_names:
+        sheets[nome] = _clean_sheet(sheets[nome])
+    timings['normalize'] = time.perf_counter() - etapa
+
+    timings['total'] = time.perf_counter() - inicio
+    return sheets, timings
+
+
+def load_data(file_path, sheet_name=None):
+    # Carregar os dados do Excel
+    if sheet_name is None:
+        sheets, _ = read_workbook(file_path, None)
+        return sheets
+    sheets, _ = read_workbook(file_path, [sheet_name])
+    return sheets[sheet_name]
+
+
+def melt_prices(base_preco):
+    # Aba de preços (ID x mês) em formato longo, uma linha por célula preenchida,
+    # em ordem cronológica (estável: dentro do mês, a ordem das linhas da aba)
+    base_preco = pd.melt(base_preco, id_vars=PRICE_ID_COLUMNS,
+                         var_name='MES', value_name='PRECO').dropna(subset=['PRECO'])
+    base_preco['MES'] = pd.to_datetime(base_preco['MES'])
+    base_preco = base_preco.sort_values('MES', kind='mergesort')
+    return base_preco.reset_index(drop=True)
+
+
+def merge_price_history(base_dados, base_preco):
+    # Transforma a aba de preços (ID x mês) em formato longo e junta aos atributos
+    base_preco = melt_prices(base_preco)
+    posicoes = history_positions(base_dados, base_preco)
+    return base_preco, build_history(base_dados, base_preco, posicoes['linha'], posicoes['linha_preco'])
+
+
+def sort_history(dados_mesclados):
+    # Ordenado por (ID, MES): o histórico de cada ID fica contíguo e em ordem cronológica
+    dados_mesclados = dados_mesclados.sort_values(['ID', 'MES'], kind='mergesort', na_position='last')
+    return dados_mesclados.reset_index(drop=True)
+
+
+def history_positions(base_dados, base_preco):
+    """Linha de base_dados e de base_preco (-1: sem preço) de cada linha do histórico mesclado.
+
+    Junção à esquerda pelo ID e ordem de sort_history, feitas só sobre as chaves; o
+    histórico em si sai de build_history.
+    """
+    dados = pd.DataFrame({'ID': base_dados['ID'].to_numpy(),
+                          'linha': np.arange(len(base_dados), dtype='int32')})
+    precos = pd.DataFrame({'ID': base_preco['ID'].to_numpy(), 'MES': base_preco['MES'].to_numpy(),
+                           'linha_preco': np.arange(len(base_preco), dtype='int32')})
+    posicoes = sort_history(pd.merge(dados, precos, on='ID', how='left'))
+    posicoes['linha_preco'] = posicoes['linha_preco'].fillna(-1).astype('int32')
+    return posicoes
+
+
+def build_history(base_dados, base_preco, linhas, linhas_preco):
+    # Atributos de cada linha de base_dados ao lado do mês/preço da linha de base_preco
+    # (vazios onde a posição é -1)
+    atributos = base_dados.take(np.asarray(linhas)).reset_index(drop=True)
+    precos = base_preco.drop(columns='ID').reindex(np.asarray(linhas_preco)).reset_index(drop=True)
+    return pd.concat([atributos, precos], axis=1)
+
+
+def compact_dtypes(df):
+    """Esquema enxuto: atributos categóricos, IDs int32 e preços float32.
+
+    IDs e preços só são reduzidos quando a conversão não perde informação: IDs
+    fracionários (ex.: 2.994) continuam float64 e preços só viram float32 se todos
+    voltam ao mesmo valor em centavos.
+    """
+    df = df.copy()
+    for coluna in TEXT_COLUMNS:
+        if coluna in df.columns:
+            if isinstance(df[coluna].dtype, pd.CategoricalDtype):
+                # Partições de versões diferentes da planilha: só as categorias em uso, em ordem
+                categorias = df[coluna]
+                codigos = categorias.cat.codes.to_numpy()
+                em_uso = np.bincount(codigos[codigos >= 0], minlength=len(categorias.cat.categories)) > 0
+                if not em_uso.all():
+                    categorias = categorias.cat.remove_categories(categorias.cat.categories[~em_uso])
+                if not categorias.cat.categories.is_monotonic_increasing:
+                    categorias = categorias.cat.reorder_categories(categorias.cat.categories.sort_values())
+                df[coluna] = categorias
+            else:
+                df[coluna] = df[coluna].astype('category')
+
+    if 'ID' in df.columns:
+        ids = df['ID']
+        if ids.notna().all() and (ids % 1 == 0).all() and ids.abs().max() < 2 ** 31:
+            df['ID'] = ids.astype('int32')
+
+    if 'PRECO' in df.columns:
+        precos = df['PRECO'].to_numpy(dtype='float64')
+        reduzidos = precos.astype('float32')
+        if np.array_equal(np.round(reduzidos.astype('float64'), 2), precos, equal_nan=True):
+            df['PRECO'] = reduzidos
+
+    if 'MES' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['MES'].dtype):
+        df['MES'] = pd.to_datetime(df['MES'])
+    return df
+
+
+def memory_report(antes, depois):
+    # Bytes (incluindo o conteúdo das strings) por coluna, antes e depois
+    uso_antes = antes.memory_usage(deep=True, index=False)
+    uso_depois = depois.memory_usage(deep=True, index=False)
+    return {
+        'antes': int(uso_antes.sum()),
+        'depois': int(uso_depois.sum()),
+        'colunas': {str(coluna): [int(uso_antes[coluna]), int(uso_depois[coluna])] for coluna in uso_depois.index},
+    }
+
+
+def file_fingerprint(file_path):
+    """Tamanho, mtime e hash do conteúdo do arquivo, ou None se não for local."""
+    if not os.path.isfile(file_path):
+        return None
+
+    stat = os.stat(file_path)
+    chave = os.path.abspath(file_path)
+    memo = _fingerprints.get(chave)
+    if memo is not None and memo['size'] == stat.st_size and memo['mtime_ns'] == stat.st_mtime_ns:
+        return memo
+
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 20), b''):
+            sha.update(bloco)
+
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha.hexdigest()}
+    _fingerprints[chave] = fingerprint
+    return fingerprint
+
+
+def sheet_signatures(file_path, sheet_names):
+    """Assinatura de cada aba (CRC32 e tamanho no zip do .xlsx/.xlsm), sem descompactar nada.
+
+    A tabela de textos compartilhados entra na assinatura de todas as abas, já que
+    as células de texto apontam para ela. Retorna None se o arquivo não for um zip.
+    """
+    try:
+        with zipfile.ZipFile(file_path) as arquivo:
+            workbook = ElementTree.fromstring(arquivo.read('xl/workbook.xml'))
+            rels = ElementTree.fromstring(arquivo.read('xl/_rels/workbook.xml.rels'))
+            # Destinos relativos a xl/ ou absolutos no pacote, conforme quem gravou o arquivo
+            alvos = {rel.get('Id'): rel.get('Target') for rel in rels}
+            alvos = {id_: alvo.lstrip('/') if alvo.startswith('/') else f"xl/{alvo}" for id_, alvo in alvos.items()}
+
+            textos = []
+            for rel in rels:
+                if rel.get('Type', '').endswith('/sharedStrings'):
+                    info = arquivo.getinfo(alvos[rel.get('Id')])
+                    textos = [info.CRC, info.file_size]
+
+            membros = {sheet.get('name'): alvos.get(sheet.get(f"{{{XLSX_NS['rel']}}}id"))
+                       for sheet in workbook.iter(f"{{{XLSX_NS['main']}}}sheet")}
+
+            assinaturas = {}
+            for nome in sheet_names:
+                info = arquivo.getinfo(membros[nome])
+                assinaturas[nome] = [info.CRC, info.file_size] + textos
+            return assinaturas
+    except (OSError, KeyError, zipfile.BadZipFile, ElementTree.ParseError):
+        return None
+
+
+def _month_keys(base_preco):
+    # Mês (AAAA-MM-DD) de cada coluna de preço da aba larga, convertido como em melt_prices
+    colunas = [coluna for coluna in base_preco.columns if coluna not in PRICE_ID_COLUMNS]
+    meses = pd.to_datetime(pd.Series(colunas, dtype=object)).astype(str)
+    return dict(zip(colunas, meses))
+
+
+def month_signatures(base_preco):
+    """Assinatura de cada mês da aba de preços (formato largo), para a carga incremental.
+
+    Cobre as células preenchidas do mês, na ordem das linhas, com o ID/STATUS/CATEGORIA
+    de cada uma: exatamente as linhas que o mês gera em melt_prices.
+    """
+    chaves = _row_hashes(base_preco[PRICE_ID_COLUMNS]).to_numpy()
+    hashes = {}
+    for coluna, mes in _month_keys(base_preco).items():
+        precos = base_preco[coluna].to_numpy(dtype='float64')
+        preenchidas = ~np.isnan(precos)
+        sha = hashes.setdefault(mes, hashlib.sha1())
+        sha.update(chaves[preenchidas].tobytes())
+        sha.update(precos[preenchidas].tobytes())
+    return {mes: sha.hexdigest() for mes, sha in hashes.items()}
+
+
+def _cache_paths(file_path):
+    pasta = os.path.join(os.path.dirname(os.path.abspath(file_path)), CACHE_DIR)
+    base = os.path.join(pasta, os.path.basename(file_path))
+    return pasta, {
+        'manifest': f"{base}.manifest.json",
+        'dados': f"{base}.dados.parquet",
+        # Prefixos dos arquivos por partição (ano): preços em ordem cronológica e, do histórico
+        # mesclado, só as posições (linha em dados, linha na partição de preços) em ordem (ID, MES)
+        'preco': f"{base}.preco",
+        'mesclados': f"{base}.mesclados",
+        # Matriz séries × meses em .npy, mapeada em memória (prefixo; o nome leva a versão
+        # do cache e o sha256 da planilha)
+        'matriz': f"{base}.matriz",
+    }
+
+
+def _partition_path(caminhos, tabela, rotulo):
+    return f"{caminhos[tabela]}.{rotulo}.parquet"
+
+
+def _temp_path(caminho):
+    # Temporário exclusivo do processo/thread: gravações concorrentes do mesmo arquivo não se
+    # atropelam, e o rename final é atômico
+    return f"{caminho}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _matrix_path(file_path, fingerprint):
+    _, caminhos = _cache_paths(file_path)
+    return f"{caminhos['matriz']}.v{CACHE_VERSION}.{fingerprint['sha256'][:16]}.npy"
+
+
+def _partition_codes(meses):
+    # Código da partição de cada linha, em ordem cronológica (NaT: 'sem_mes', o último), e o
+    # rótulo de cada código; só os anos distintos são formatados
+    codigos, anos = pd.factorize(pd.DatetimeIndex(meses).year, sort=True)
+    rotulos = [f"{ano:.0f}" for ano in anos] + [NO_MONTH_PARTITION]
+    return np.where(codigos < 0, len(anos), codigos), rotulos
+
+
+def _partition_labels(meses):
+    # Rótulo da partição de cada linha: AAAA do ano, ou 'sem_mes' para NaT
+    codigos, rotulos = _partition_codes(meses)
+    return np.array(rotulos, dtype=object)[codigos]
+
+
+def _split_partitions(df, meses):
+    """{partição: linhas de df}, na ordem de df e com as partições em ordem cronológica.
+
+    Uma tabela vazia vira uma única partição vazia, que guarda o esquema.
+    """
+    if len(df) == 0:
+        return {NO_MONTH_PARTITION: df}
+    codigos, rotulos = _partition_codes(meses)
+    return {rotulos[codigo]: df[codigos == codigo].reset_index(drop=True) for codigo in np.unique(codigos)}
+
+
+def _sorted_partitions(partes):
+    # Partições em ordem cronológica, 'sem_mes' por último
+    return dict(sorted(partes.items(), key=lambda item: (item[0] == NO_MONTH_PARTITION, item[0])))
+
+
+def _partition_starts(precos):
+    # Linha de base_preco em que começa cada partição de preços
+    return dict(zip(precos, np.cumsum([0] + [len(parte) for parte in precos.values()])))
+
+
+def _split_positions(posicoes, precos):
+    # Posições do histórico inteiro por partição, com a linha de preço relativa à partição
+    inicios = _partition_starts(precos)
+    partes = _split_partitions(posicoes[['linha', 'linha_preco']], posicoes['MES'])
+    for rotulo, parte in partes.items():
+        linhas_preco = parte['linha_preco'].to_numpy()
+        parte['linha_preco'] = np.where(linhas_preco >= 0, linhas_preco - inicios.get(rotulo, 0), -1).astype('int32')
+    return partes
+
+
+def _restore_prices(df):
+    # Preços float32 de volta aos valores originais em float64 (1234.56, não 1234.5600586),
+    # para juntar com partições que não puderam ser reduzidas
+    if df['PRECO'].dtype == np.float32:
+        df = df.assign(PRECO=np.round(df['PRECO'].to_numpy(dtype='float64'), 2))
+    return df
+
+
+def _concat_partitions(partes):
+    """Junta as partições de preços com os tipos que compact_dtypes daria à tabela inteira."""
+    if len(partes) == 1:
+        return partes[0]
+    if any(parte['PRECO'].dtype == np.float64 for parte in partes):
+        partes = [_restore_prices(parte) for parte in partes]
+    colunas = {}
+    for coluna in partes[0].columns:
+        valores = [parte[coluna] for parte in partes]
+        if all(isinstance(valor.dtype, pd.CategoricalDtype) for valor in valores):
+            # Cada partição tem só as suas categorias: une e ordena, sem passar por texto
+            colunas[coluna] = pd.api.types.union_categoricals(valores, sort_categories=True)
+        else:
+            colunas[coluna] = pd.concat(valores, ignore_index=True)
+    return pd.DataFrame(colunas)
+
+
+def _assemble(base_dados, precos, posicoes):
+    """Monta (base_preco, dados_mesclados) a partir das partições do cache.
+
+    As posições de cada partição já estão em ordem (ID, MES) e as partições vêm em ordem
+    cronológica: a ordenação estável pelo ID só intercala os trechos.
+    """
+    base_preco = _concat_partitions(list(precos.values()))
+    inicios = _partition_starts(precos)
+    linhas = np.concatenate([parte['linha'].to_numpy() for parte in posicoes.values()])
+    linhas_preco = np.concatenate([
+        np.where(parte['linha_preco'] >= 0, parte['linha_preco'] + inicios.get(rotulo, 0), -1)
+        for rotulo, parte in posicoes.items()])
+
+    codigos, ids = pd.factorize(base_dados['ID'], sort=True)
+    # No menor inteiro sem sinal que comporta os códigos: até 65 mil IDs, o NumPy ordena
+    # de forma estável por radix sort
+    codigos = np.where(codigos < 0, len(ids), codigos).astype(np.min_scalar_type(len(ids)))
+    ordem = np.argsort(codigos[linhas], kind='stable')
+    linhas, linhas_preco = linhas[ordem], linhas_preco[ordem]
+
+    # Atributos já compactados em base_dados; do lado dos preços, só as categorias em uso
+    # e a redução de PRECO decidida sobre as linhas mescladas, como na carga completa
+    atributos = base_dados.take(linhas).reset_index(drop=True)
+    mesclados = compact_dtypes(base_preco.drop(columns='ID').reindex(linhas_preco).reset_index(drop=True))
+    return base_preco, pd.concat([atributos, mesclados], axis=1)
+
+
+def _read_manifest(file_path, sheets):
+    _, caminhos = _cache_paths(file_path)
+    try:
+        with open(caminhos['manifest'], encoding='utf-8') as arquivo:
+            manifest = json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get('version') != CACHE_VERSION or manifest.get('sheets') != list(sheets):
+        return None
+    return manifest
+
+
+def _read_cache(file_path, manifest):
+    """(base_dados, {partição: preços}, {partição: posições}) do cache, ou None."""
+    _, caminhos = _cache_paths(file_path)
+    last_rejected_prices.clear()
+    last_rejected_prices.update(manifest.get('rejected_prices', {}))
+    last_memory_report.clear()
+    last_memory_report.update(manifest.get('memory', {}))
+    try:
+        # memory_map: o Arrow lê as colunas direto das páginas do arquivo, sem buffer intermediário
+        base_dados = pd.read_parquet(caminhos['dados'], memory_map=True)
+        partes = {tabela: {rotulo: pd.read_parquet(_partition_path(caminhos, tabela, rotulo), memory_map=True)
+                           for rotulo in manifest['partitions'][tabela]}
+                  for tabela in ('preco', 'mesclados')}
+    except Exception:
+        return None
+    return base_dados, partes['preco'], partes['mesclados']
+
+
+def _write_cache(file_path, fingerprint, sheets, base_dados, precos, posicoes, partitions,
+                 signatures=None, months=None):
+    """Grava o cache e, por último, o manifesto.
+
+    Só as tabelas recebidas são gravadas: base_dados (None mantém o arquivo atual) e as
+    partições em precos/posicoes. Arquivos de partições fora de `partitions` são apagados.
+    """
+    pasta, caminhos = _cache_paths(file_path)
+    temporario = None
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        # Sem manifesto durante a gravação: um cache pela metade nunca é considerado válido
+        if os.path.exists(caminhos['manifest']):
+            os.remove(caminhos['manifest'])
+
+        arquivos = [] if base_dados is None else [(caminhos['dados'], base_dados)]
+        arquivos += [(_partition_path(caminhos, 'preco', rotulo), df) for rotulo, df in precos.items()]
+        arquivos += [(_partition_path(caminhos, 'mesclados', rotulo), df) for rotulo, df in posicoes.items()]
+        for caminho, df in arquivos:
+            temporario = _temp_path(caminho)
+            df.to_parquet(temporario, index=False)
+            os.replace(temporario, caminho)
+
+        # Partições que deixaram de existir (ex.: ano cujos meses foram todos removidos)
+        for tabela, rotulos in partitions.items():
+            prefixo = f"{caminhos[tabela]}."
+            for caminho in glob.glob(f"{glob.escape(prefixo)}*.parquet"):
+                if caminho[len(prefixo):-len('.parquet')] not in rotulos:
+                    os.remove(caminho)
+
+        # Manifesto gravado por último, com as assinaturas de cada aba e de cada mês de preços
+        manifest = dict(fingerprint, version=CACHE_VERSION, sheets=list(sheets), signatures=signatures,
+                        months=months, partitions=partitions, parse_timings=last_parse_timings,
+                        rejected_prices=last_rejected_prices, memory=last_memory_report)
+        temporario = _temp_path(caminhos['manifest'])
+        with open(temporario, 'w', encoding='utf-8') as arquivo:
+            json.dump(manifest, arquivo)
+        os.replace(temporario, caminhos['manifest'])
+    except Exception:
+        # Falha no cache não pode impedir o carregamento dos dados
+        if temporario is not None and os.path.exists(temporario):
+            try:
+                os.remove(temporario)
+            except OSError:
+                pass
+
+
+def _row_hashes(df):
+    # Hash por linha independente do tipo de armazenamento (categoria/texto, int32/float64)
+    canonico = {}
+    for coluna in df.columns:
+        valores = df[coluna]
+        if pd.api.types.is_numeric_dtype(valores.dtype) and not pd.api.types.is_bool_dtype(valores.dtype):
+            canonico[coluna] = valores.astype('float64')
+        else:
+            valores = valores.astype(object)
+            canonico[coluna] = valores.where(valores.notna(), '').astype(str)
+    return pd.util.hash_pandas_object(pd.DataFrame(canonico), index=False)
+
+
+def _ingest_changes(file_path, fingerprint, sheets, manifest):
+    """Atualiza o cache a partir da versão anterior, relendo só as abas alteradas.
+
+    Na aba de preços, só os meses com assinatura diferente são convertidos de novo, e só
+    os anos desses meses são remesclados e regravados; os demais vêm do cache como estão.
+    Uma alteração na aba Data refaz as posições do histórico inteiro, sem reler os preços.
+    Retorna None quando não há base anterior utilizável (carga completa).
+    """
+    aba_dados, aba_precos = sheets
+    assinaturas = sheet_signatures(file_path, sheets)
+    anteriores = manifest.get('signatures')
+    if assinaturas is None or not anteriores:
+        return None
+
+    inicio = time.perf_counter()
+    alteradas = [aba for aba in sheets if assinaturas[aba] != anteriores.get(aba)]
+    cached = _read_cache(file_path, manifest)
+    if cached is None:
+        return None
+    base_dados, precos, posicoes = cached
+
+    timings = {}
+    rejeitados = dict(manifest.get('rejected_prices', {}))
+    if alteradas:
+        sheets_novas, timings = read_workbook(file_path, alteradas)
+        rejeitados.update({aba: sheets_novas[aba].attrs.get('precos_rejeitados', 0) for aba in alteradas})
+    etapa = time.perf_counter()
+
+    meses = manifest.get('months') or {}
+    refeitas = set()
+    if aba_precos in alteradas:
+        largura = sheets_novas[aba_precos]
+        novos = month_signatures(largura)
+        alterados = {mes for mes in set(meses) | set(novos) if meses.get(mes) != novos.get(mes)}
+        meses = novos
+        colunas = [coluna for coluna, mes in _month_keys(largura).items() if mes in alterados]
+        linhas_novas = melt_prices(largura[PRICE_ID_COLUMNS + colunas])
+        rotulos_novos = _partition_labels(linhas_novas['MES'])
+
+        # Cada ano atingido: meses intactos do cache + meses alterados, em ordem cronológica
+        datas = pd.to_datetime(sorted(alterados))
+        refeitas = set(_partition_labels(datas))
+        for rotulo in refeitas:
+            partes = [linhas_novas[rotulos_novos == rotulo]]
+            if rotulo in precos:
+                antiga = precos[rotulo]
+                partes.insert(0, _restore_prices(antiga[~antiga['MES'].isin(datas)]))
+            parte = pd.concat(partes, ignore_index=True).sort_values('MES', kind='mergesort')
+            if len(parte):
+                precos[rotulo] = compact_dtypes(parte.reset_index(drop=True))
+            else:
+                precos.pop(rotulo, None)
+        precos = _sorted_partitions(precos)
+        if not precos:
+            return None
+
+    if aba_dados in alteradas:
+        nova_dados = compact_dtypes(sheets_novas[aba_dados])
+        if list(nova_dados.columns) != list(base_dados.columns):
+            return None
+        base_dados = nova_dados
+        posicoes = history_positions(base_dados, _concat_partitions(list(precos.values())))
+        posicoes = _split_positions(posicoes, precos)
+        refeitas_mescladas = set(posicoes)
+    else:
+        refeitas_mescladas = set(refeitas)
+        for rotulo in refeitas - {NO_MONTH_PARTITION}:
+            if rotulo in precos:
+                novas = history_positions(base_dados, precos[rotulo])
+                novas = novas[novas['linha_preco'] >= 0]
+                posicoes[rotulo] = novas[['linha', 'linha_preco']].reset_index(drop=True)
+            else:
+                posicoes.pop(rotulo, None)
+        if aba_precos in alteradas:
+            # Sem mês: preços sem data e os IDs sem nenhum preço na aba larga
+            refeitas_mescladas.add(NO_MONTH_PARTITION)
+            vazia = next(iter(precos.values())).iloc[:0]
+            novas = history_positions(base_dados, precos.get(NO_MONTH_PARTITION, vazia))
+            com_preco = largura.loc[largura[list(_month_keys(largura))].notna().any(axis=1), 'ID']
+            novas = novas[(novas['linha_preco'] >= 0) | ~novas['ID'].isin(com_preco)]
+            posicoes[NO_MONTH_PARTITION] = novas[['linha', 'linha_preco']].reset_index(drop=True)
+        posicoes = _sorted_partitions({rotulo: parte for rotulo, parte in posicoes.items() if len(parte)})
+        if not posicoes:
+            return None
+
+    base_preco, dados_mesclados = _assemble(base_dados, precos, posicoes)
+    timings['merge'] = time.perf_counter() - etapa
+    timings['total'] = time.perf_counter() - inicio
+
+    last_parse_timings.clear()
+    last_parse_timings.update(timings)
+    last_ingest.clear()
+    last_ingest.update(mode='incremental', sheets=alteradas, partitions=sorted(refeitas | refeitas_mescladas))
+    last_rejected_prices.clear()
+    last_rejected_prices.update(rejeitados)
+
+    _write_cache(file_path, fingerprint, sheets, base_dados if aba_dados in alteradas else None,
+                 {rotulo: precos[rotulo] for rotulo in refeitas if rotulo in precos},
+                 {rotulo: posicoes[rotulo] for rotulo in refeitas_mescladas if rotulo in posicoes},
+                 {'preco': list(precos), 'mesclados': list(posicoes)}, signatures=assinaturas, months=meses)
+    return base_dados, base_preco, dados_mesclados
+
+
+def load_dataset(file_path, aba_dados='Data', aba_precos='Preco', use_cache=True):
+    """Carrega (base_dados, base_preco, dados_mesclados), usando o cache Parquet se válido.
+
+    Se a planilha mudou desde o último cache, tenta primeiro a carga incremental.
+    """
+    abas = (aba_dados, aba_precos)
+    fingerprint = file_fingerprint(file_path) if use_cache else None
+
+    if fingerprint is not None:
+        manifest = _read_manifest(file_path, abas)
+        if manifest is not None:
+            # O hash do conteúdo decide: um arquivo apenas "tocado" (mtime novo) continua válido
+            if manifest.get('sha256') == fingerprint['sha256']:
+                with span('cache.leitura') as medida:
+                    cached = _read_cache(file_path, manifest)
+                    if cached is not None:
+                        cached = (cached[0], *_assemble(*cached))
+                    medida.linhas_saida = None if cached is None else len(cached[2])
+                if cached is not None:
+                    last_ingest.clear()
+                    last_ingest.update(mode='cache')
+            else:
+                with span('cache.incremental') as medida:
+                    cached = _ingest_changes(file_path, fingerprint, abas, manifest)
+                    medida.linhas_saida = None if cached is None else len(cached[2])
+            if cached is not None:
+                return cached
+
+    with span('planilha.leitura') as medida:
+        sheets, timings = read_workbook(file_path, abas)
+        medida.linhas_saida = sum(len(df) for df in sheets.values())
+    etapa = time.perf_counter()
+    with span('planilha.mesclagem', len(sheets[aba_precos])) as medida:
+        base_dados = sheets[aba_dados]
+        base_preco = melt_prices(sheets[aba_precos])
+        posicoes = history_positions(base_dados, base_preco)
+        dados_mesclados = build_history(base_dados, base_preco, posicoes['linha'], posicoes['linha_preco'])
+        medida.output(dados_mesclados)
+    timings['merge'] = time.perf_counter() - etapa
+
+    etapa = time.perf_counter()
+    bases = {'base_dados': base_dados, 'base_preco': base_preco, 'dados_mesclados': dados_mesclados}
+    with span('planilha.compactacao', sum(len(df) for df in bases.values())):
+        compactas = {nome: compact_dtypes(df) for nome, df in bases.items()}
+    timings['compact'] = time.perf_counter() - etapa
+    last_memory_report.clear()
+    last_memory_report.update({nome: memory_report(bases[nome], compactas[nome]) for nome in bases})
+    base_dados, base_preco, dados_mesclados = compactas.values()
+
+    last_parse_timings.clear()
+    last_parse_timings.update(timings)
+    last_ingest.clear()
+    last_ingest.update(mode='completa', sheets=list(abas))
+    last_rejected_prices.clear()
+    last_rejected_prices.update({aba: sheets[aba].attrs.get('precos_rejeitados', 0) for aba in abas})
+
+    if fingerprint is not None:
+        with span('cache.escrita', len(dados_mesclados)):
+            precos = {rotulo: compact_dtypes(parte)
+                      for rotulo, parte in _split_partitions(base_preco, base_preco['MES']).items()}
+            particoes = _split_positions(posicoes, precos)
+            _write_cache(file_path, fingerprint, abas, base_dados, precos, particoes,
+                         {'preco': list(precos), 'mesclados': list(particoes)},
+                         signatures=sheet_signatures(file_path, abas), months=month_signatures(sheets[aba_precos]))
+
+    return base_dados, base_preco, dados_mesclados
+
+
+class SelectionIndex:
+    """Árvore Categoria → Marca → Modelo → Versão com as posições das linhas de cada nó.
+
+    Montada uma vez por dataset; popular os filtros e selecionar as linhas de um
+    modelo passam a ser consultas a dicionários em vez de máscaras sobre a tabela.
+    """
+
+    def __init__(self, dados, niveis=SELECTION_LEVELS):
+        self._arvore = {}
+        self._posicoes = {}
+        grupos = dados.groupby(list(niveis), sort=False, dropna=False, observed=True).indices
+
+        for chave, posicoes in grupos.items():
+            # Linhas sem categoria não têm preço e nunca são selecionáveis
+            if pd.isna(chave[0]):
+                continue
+            chave = tuple(None if pd.isna(valor) else valor for valor in chave)
+            no = self._arvore
+            for valor in chave[:-1]:
+                no = no.setdefault(valor, {})
+            no[chave[-1]] = posicoes
+
+        # Posições agregadas por prefixo (categoria, marca, modelo), já ordenadas
+        for categoria, marcas in self._arvore.items():
+            for marca, modelos in marcas.items():
+                for modelo, versoes in modelos.items():
+                    self._posicoes[(categoria, marca, modelo)] = np.sort(np.concatenate(list(versoes.values())))
+
+    def _no(self, *chave):
+        no = self._arvore
+        for valor in chave:
+            no = no.get(valor)
+            if no is None:
+                return {}
+        return no
+
+    @staticmethod
+    def _opcoes(no):
+        return sorted((valor for valor in no if valor is not None), key=str)
+
+    def categorias(self):
+        return self._opcoes(self._arvore)
+
+    def marcas(self, categoria):
+        return self._opcoes(self._no(categoria))
+
+    def modelos(self, categoria, marca):
+        return self._opcoes(self._no(categoria, marca))
+
+    def versoes(self, categoria, marca, modelo):
+        return self._opcoes(self._no(categoria, marca, modelo))
+
+    def positions(self, categoria, marca, modelo, versao=None):
+        """Posições (ordenadas) das linhas do modelo, ou de uma versão específica."""
+        if versao is not None:
+            return self._no(categoria, marca, modelo).get(versao, np.empty(0, dtype='int64'))
+        return self._posicoes.get((categoria, marca, modelo), np.empty(0, dtype='int64'))
+
+
+def _load_matrix(arquivo, forma, tipo):
+    # Matriz já gravada por este ou outro processo, se for da mesma forma e tipo
+    try:
+        valores = np.load(arquivo, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if valores.shape != forma or valores.dtype != tipo:
+        return None
+    return valores
+
+
+def _share_matrix(arquivo, valores):
+    # Grava a matriz (arquivo temporário + rename, leitores nunca veem um .npy parcial)
+    # e devolve o mapeamento; sem permissão de escrita, segue com a cópia em memória
+    pasta = os.path.dirname(arquivo)
+    # Prefixo comum às matrizes da planilha: <arquivo>.matriz
+    prefixo = os.path.basename(arquivo).rsplit('.', 3)[0]
+    temporario = _temp_path(arquivo)
+    try:
+        os.makedirs(pasta, exist_ok=True)
+        with open(temporario, 'wb') as f:
+            np.save(f, valores)
+        os.replace(temporario, arquivo)
+        # Matrizes de versões anteriores da planilha ou do cache (processos que ainda as usam
+        # mantêm o mapeamento)
+        for nome in os.listdir(pasta):
+            caminho = os.path.join(pasta, nome)
+            if nome.startswith(f"{prefixo}.") and nome.endswith('.npy') and caminho != arquivo:
+                os.remove(caminho)
+        return np.load(arquivo, mmap_mode='r')
+    except OSError:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        return valores
+
+
+class PriceMatrix:
+    """Índice derivado: preços numa matriz densa séries × meses, atributos numa tabela à parte.
+
+    Não substitui o armazenamento: é montada a partir de dados_mesclados, que continua
+    carregada e é a fonte do histórico, dos últimos preços e do comparativo (linhas sem
+    preço e ordem (ID, MES) que a matriz não reproduz). A memória dela (nbytes) soma-se
+    à da tabela longa; não há mapa ID → linhas.
+
+    Cada série é um par linha da aba Data × linha da aba Preco (os IDs se repetem
+    entre marcas e entre ativo/inativo). As séries são ordenadas por Categoria,
+    Marca, Modelo e ID: o recorte de um modelo num período é uma fatia da matriz
+    (view, sem cópia). Serve a matriz por versão, os indicadores e a busca de
+    semelhantes.
+    """
+
+    def __init__(self, dados_mesclados, arquivo=None):
+        com_preco = dados_mesclados[dados_mesclados['MES'].notna()]
+        colunas = [coluna for coluna in dados_mesclados.columns if coluna not in ('MES', 'PRECO')]
+        self.meses = pd.DatetimeIndex(com_preco['MES'].unique()).sort_values()
+
+        # Uma série por combinação de atributos, na ordem Categoria/Marca/Modelo/ID
+        serie = com_preco.groupby(colunas, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+        primeiras = np.unique(serie, return_index=True)[1]
+        atributos = com_preco[colunas].iloc[primeiras].reset_index(drop=True)
+        ordem = atributos.sort_values(SELECTION_LEVELS[:3] + ['ID'], kind='mergesort').index.to_numpy()
+        self.atributos = atributos.take(ordem).reset_index(drop=True)
+        linha = np.empty(len(ordem), dtype='int64')
+        linha[ordem] = np.arange(len(ordem))
+
+        # Matriz contígua (C) no tipo já compactado dos preços; célula vazia = NaN.
+        # Com `arquivo`, vem de um .npy mapeado em memória: processos que abrem a mesma
+        # versão da planilha compartilham as páginas em vez de ter uma cópia cada
+        forma, tipo = (len(ordem), len(self.meses)), com_preco['PRECO'].dtype
+        self.valores = _load_matrix(arquivo, forma, tipo) if arquivo else None
+        if self.valores is None:
+            valores = np.full(forma, np.nan, dtype=tipo)
+            valores[linha[serie], self.meses.searchsorted(com_preco['MES'])] = com_preco['PRECO'].to_numpy()
+            self.valores = _share_matrix(arquivo, valores) if arquivo else valores
+        # Compartilhada entre sessões: somente leitura
+        self.valores.flags.writeable = False
+
+        # Modelo -> fatia de linhas
+        self._modelos = {}
+        grupos = self.atributos.groupby(SELECTION_LEVELS[:3], sort=False, dropna=False, observed=True).indices
+        for chave, posicoes in grupos.items():
+            chave = tuple(None if pd.isna(valor) else valor for valor in chave)
+            self._modelos[chave] = slice(int(posicoes[0]), int(posicoes[-1]) + 1)
+
+    @property
+    def nbytes(self):
+        return self.valores.nbytes + int(self.atributos.memory_usage(deep=True, index=False).sum())
+
+    def model_rows(self, categoria, marca, modelo):
+        """Fatia das séries do modelo (vazia se o modelo não tiver preços)."""
+        return self._modelos.get((categoria, marca, modelo), slice(0, 0))
+
+    def month_window(self, data_inicial=None, data_final=None):
+        """Fatia do eixo de meses no período [data_inicial, data_final]."""
+        inicio = 0 if data_inicial is None else self.meses.searchsorted(pd.Timestamp(data_inicial), side='left')
+        fim = len(self.meses) if data_final is None else \
+            self.meses.searchsorted(pd.Timestamp(data_final), side='right')
+        return slice(int(inicio), int(max(inicio, fim)))
+
+    def block(self, categoria, marca, modelo, data_inicial=None, data_final=None):
+        """(atributos, meses, valores) do modelo no período; valores é uma view da matriz."""
+        linhas = self.model_rows(categoria, marca, modelo)
+        colunas = self.month_window(data_inicial, data_final)
+        return self.atributos.iloc[linhas], self.meses[colunas], self.valores[linhas, colunas]
+
+
+class PriceDataset:
+    """Bases carregadas e estruturas derivadas, montadas uma vez por versão da planilha.
+
+    dados_mesclados (tabela longa) é o armazenamento; matrix, selection_index e
+    latest_prices são índices montados sobre ela.
+    """
+
+    def __init__(self, base_dados, base_preco, dados_mesclados, fingerprint=None):
+        self.base_dados = base_dados
+        self.base_preco = base_preco
+        self.dados_mesclados = dados_mesclados
+        self.fingerprint = fingerprint
+        # Arquivo .npy da matriz séries × meses (definido pelo DatasetStore); None = só em memória
+        self.matrix_path = None
+        # Índice de semelhantes: montado na primeira busca, uma vez entre as sessões
+        self._similarity = None
+        self._similarity_lock = threading.Lock()
+
+        # Eixo de meses ordenado, convertido uma única vez
+        self.meses = pd.DatetimeIndex(dados_mesclados['MES'].dropna().unique()).sort_values()
+
+        # Chave composta (posição do ID, posição do mês), não decrescente na ordem da tabela;
+        # meses ausentes (NaT) ficam depois de qualquer mês válido do mesmo ID
+        self._ids, id_rank = np.unique(dados_mesclados['ID'].to_numpy(), return_inverse=True)
+        self._stride = len(self.meses) + 1
+        mes_rank = self.meses.searchsorted(dados_mesclados['MES'])
+        mes_rank[dados_mesclados['MES'].isna().to_numpy()] = len(self.meses)
+        self._chave = id_rank.astype('int64') * self._stride + mes_rank
+
+    @property
+    def key(self):
+        return self.fingerprint['sha256'] if self.fingerprint else None
+
+    def warm(self):
+        """Monta as estruturas usadas em toda página de uma vez (antes de o dataset ser
+        compartilhado, para que sessões concorrentes não as calculem em dobro)."""
+        for estrutura in ('selection_index', 'matrix', 'analytics', 'latest_prices', '_latest_index'):
+            getattr(self, estrutura)
+        return self
+
+    def period_positions(self, posicoes, data_inicial, data_final):
+        """Restringe posições (ordenadas) da tabela longa ao período [data_inicial, data_final].
+
+        Em vez de comparar todas as datas, faz busca binária dentro do bloco de cada ID.
+        """
+        posicoes = np.asarray(posicoes)
+        if len(posicoes) == 0:
+            return posicoes
+
+        mes_inicio = self.meses.searchsorted(pd.Timestamp(data_inicial), side='left')
+        mes_fim = self.meses.searchsorted(pd.Timestamp(data_final), side='right')
+        if mes_inicio >= mes_fim:
+            return posicoes[:0]
+
+        id_rank = np.unique(self._chave[posicoes] // self._stride)
+        inicio = np.searchsorted(self._chave, id_rank * self._stride + mes_inicio, side='left')
+        fim = np.searchsorted(self._chave, id_rank * self._stride + mes_fim, side='left')
+
+        tamanhos = fim - inicio
+        if tamanhos.sum() == 0:
+            return posicoes[:0]
+        # Concatena os intervalos [inicio, fim) de cada bloco sem laço Python
+        deslocamento = np.repeat(inicio - np.cumsum(tamanhos) + tamanhos, tamanhos)
+        candidatos = deslocamento + np.arange(tamanhos.sum())
+        # IDs repetidos na aba Data compartilham o bloco: mantém só as linhas da seleção
+        return np.intersect1d(candidatos, posicoes, assume_unique=True)
+
+    @cached_property
+    def selection_index(self):
+        with span('estruturas.indice', len(self.dados_mesclados)):
+            return SelectionIndex(self.dados_mesclados)
+
+    def take(self, posicoes):
+        return self.dados_mesclados.take(posicoes)
+
+    def history(self, categoria, marca, modelo, incluir_inativos=False):
+        """Histórico de preços do modelo, com as colunas do dashboard e dos relatórios."""
+        dados = self.take(self.selection_index.positions(categoria, marca, modelo))
+        if not incluir_inativos:
+            dados = dados[dados['STATUS'] == 'Ativo']
+        return dados[HISTORY_COLUMNS].rename(columns={'MES': 'Mês', 'PRECO': 'Preço'})
+
+    @cached_property
+    def matrix(self):
+        with span('estruturas.matriz', len(self.dados_mesclados)) as etapa:
+            matriz = PriceMatrix(self.dados_mesclados, self.matrix_path)
+            etapa.linhas_saida = len(matriz.atributos)
+            etapa.bytes = matriz.nbytes
+            return matriz
+
+    @cached_property
+    def analytics(self):
+        # Só o calculador fica no dataset: indicators() calcula sob demanda as linhas pedidas,
+        # sem guardar resultado entre chamadas
+        matriz = self.matrix
+        with span('estruturas.indicadores', len(matriz.atributos)):
+            return PriceAnalytics(matriz)
+
+    @property
+    def similarity(self):
+        matriz = self.matrix
+        with self._similarity_lock:
+            if self._similarity is None:
+                with span('estruturas.semelhantes', len(matriz.atributos)):
+                    self._similarity = SimilarityIndex(matriz)
+            return self._similarity
+
+    def version_matrix(self, categoria, marca, modelo, incluir_inativos=False):
+        """Matriz versão × mês do modelo (ID, Veículo e o preço de cada mês), a partir da PriceMatrix."""
+        atributos, meses, valores = self.matrix.block(categoria, marca, modelo)
+        manter = np.ones(len(atributos), dtype=bool)
+        if not incluir_inativos:
+            manter = (atributos['STATUS'] == 'Ativo').to_numpy()
+        valores = valores[manter]
+        # Só os meses com algum preço no modelo
+        com_preco = ~np.isnan(valores).all(axis=0)
+        tabela = pd.DataFrame(valores[:, com_preco], columns=meses[com_preco])
+        tabela.insert(0, 'ID', atributos['ID'].to_numpy()[manter])
+        tabela.insert(1, 'Veículo', atributos['Veículo'].to_numpy()[manter])
+        return tabela
+
+    @cached_property
+    def latest_prices(self):
+        """Visão materializada: último preço não nulo de cada versão, com mês e status."""
+        # A tabela já está em ordem (ID, MES): a última linha de cada chave é a mais recente
+        com_preco = self.dados_mesclados.loc[self.dados_mesclados['PRECO'].notna(), LATEST_COLUMNS]
+        return (com_preco.drop_duplicates(LATEST_KEY, keep='last')
+                .sort_values(['ID', 'MES'], kind='mergesort')
+                .reset_index(drop=True))
+
+    @cached_property
+    def _latest_index(self):
+        return SelectionIndex(self.latest_prices)
+
+    def latest(self, categoria, marca, modelo, data_inicial=None, data_final=None):
+        """Último preço por versão do modelo dentro do período.
+
+        Se o período alcança o último mês da base, basta fatiar a visão materializada;
+        caso contrário, recalcula apenas sobre as linhas do modelo no período.
+        """
+        if data_final is None or pd.Timestamp(data_final) >= self.meses[-1]:
+            ultimos = self.latest_prices.take(self._latest_index.positions(categoria, marca, modelo))
+            if data_inicial is not None:
+                ultimos = ultimos[ultimos['MES'] >= pd.Timestamp(data_inicial)]
+            return ultimos
+
+        posicoes = self.selection_index.positions(categoria, marca, modelo)
+        inicio = self.meses[0] if data_inicial is None else data_inicial
+        linhas = self.take(self.period_positions(posicoes, inicio, data_final))
+        linhas = linhas.loc[linhas['PRECO'].notna(), LATEST_COLUMNS]
+        return linhas.drop_duplicates(LATEST_KEY, keep='last')
+
+    def compare(self, categoria, referencia, comparados, data_inicial, data_final):
+        """Extrai de uma vez o modelo de referência e todos os comparados no período.
+
+        `referencia` e cada item de `comparados` são pares (marca, modelo).
+        """
+        return Comparison(self, categoria, referencia, comparados, data_inicial, data_final)
+
+
+class Comparison:
+    """Resultado de uma comparação entre modelos, calculado a partir de uma única extração."""
+
+    def __init__(self, dataset, categoria, referencia, comparados, data_inicial, data_final):
+        self.referencia_chave = tuple(referencia)
+        self.comparados = [tuple(chave) for chave in comparados]
+        modelos = [self.referencia_chave] + self.comparados
+
+        # Uma busca no índice por modelo, um único recorte de período e um único take
+        indice = dataset.selection_index
+        posicoes = np.unique(np.concatenate(
+            [indice.positions(categoria, marca, modelo) for marca, modelo in modelos]))
+        self.dados = dataset.take(dataset.period_positions(posicoes, data_inicial, data_final))
+        self.dados['Versão_Completa'] = self.dados['Marca'].astype(object) + ' ' + \
+                                        self.dados['Modelo'].astype(object) + ' - ' + \
+                                        self.dados['Versão'].astype(object)
+
+        grupos = self.dados.groupby(['Marca', 'Modelo'], sort=False, observed=True).indices
+        vazio = np.empty(0, dtype='int64')
+        self.referencia = self.dados.take(grupos.get(self.referencia_chave, vazio))
+        self.comparativos = {chave: self.dados.take(grupos.get(chave, vazio)) for chave in self.comparados}
+
+        # Último preço no período de cada versão, entre todos os modelos extraídos
+        com_preco = self.dados[self.dados['PRECO'].notna()]
+        ultimos = com_preco.drop_duplicates(LATEST_KEY, keep='last')
+        self.ultimos = collapse_latest(ultimos, 'Versão_Completa')
+
+
+def collapse_latest(ultimos, coluna, coluna_mes='MES'):
+    """Um registro por valor de `coluna` (ex.: Versão): o de mês mais recente.
+
+    Em empate de mês, o registro ativo prevalece sobre o inativo.
+    """
+    ativo = (ultimos['STATUS'] == 'Ativo').to_numpy()
+    ordem = np.lexsort((ativo, ultimos[coluna_mes].to_numpy()))
+    return ultimos.take(ordem).drop_duplicates(coluna, keep='last')
+
+
+class DatasetStore:
+    """PriceDatasets somente leitura, compartilhados por todas as sessões do processo.
+
+    Um dataset por (planilha, abas). Quando a planilha muda, uma única thread monta
+    a nova versão (com as estruturas derivadas já prontas) enquanto as demais seguem
+    recebendo a anterior; a troca é a substituição de uma referência. Sem versão
+    anterior, as outras threads esperam essa carga em vez de repeti-la.
+    """
+
+    def __init__(self):
+        self._datasets = {}
+        self._cargas = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.stale_hits = 0
+
+    def _load_lock(self, chave):
+        with self._lock:
+            return self._cargas.setdefault(chave, threading.Lock())
+
+    def get(self, file_path, aba_dados='Data', aba_precos='Preco'):
+        fingerprint = file_fingerprint(file_path)
+        if fingerprint is None:
+            # Planilha remota: sem impressão digital não há como validar uma versão guardada
+            return PriceDataset(*load_dataset(file_path, aba_dados, aba_precos), fingerprint=None)
+
+        chave = (os.path.abspath(file_path), aba_dados, aba_precos)
+        atual = self._datasets.get(chave)
+        if atual is not None and atual[0] == fingerprint['sha256']:
+            return atual[1]
+
+        carga = self._load_lock(chave)
+        if not carga.acquire(blocking=atual is None):
+            # Outra sessão já está montando a nova versão: segue com a anterior até a troca
+            self.stale_hits += 1
+            return atual[1]
+        try:
+            atual = self._datasets.get(chave)
+            if atual is not None and atual[0] == fingerprint['sha256']:
+                return atual[1]
+            dataset = PriceDataset(*load_dataset(file_path, aba_dados, aba_precos), fingerprint=fingerprint)
+            dataset.matrix_path = _matrix_path(file_path, fingerprint)
+            dataset.warm()
+            self._datasets[chave] = (fingerprint['sha256'], dataset)
+            self.loads += 1
+            return dataset
+        finally:
+            carga.release()
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
+
+    def stats(self):
+        return {
+            'datasets': len(self._datasets),
+            'loads': self.loads,
+            'stale_hits': self.stale_hits,
+            'matrix_mapped': sum(isinstance(dataset.matrix.valores, np.memmap)
+                                 for _, dataset in list(self._datasets.values())),
+        }
+
+
+# Store do processo, compartilhado por todas as sessões do dashboard
+dataset_store = DatasetStore()
+
+
+def get_dataset(file_path, aba_dados='Data', aba_precos='Preco'):
+    """PriceDataset da planilha, compartilhado no processo enquanto o arquivo não mudar."""
+    return dataset_store.get(file_path, aba_dados, aba_precos)
@@ -1,174 +1,160 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import openpyxl
-from io import BytesIO
-from pptx import Presentation
-from pptx.util import Inches
 import matplotlib.pyplot as plt
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-import tempfile
-import os
 
+import numpy as np
+
+from analytics import rebase
+from charts import build_comparison_figure, build_history_figure, build_index_figure, figure_cache, figure_size
+from reports import create_excel_report, create_pdf_report, create_ppt_report, report_jobs, report_key
+from dataset import collapse_latest, dataset_store, get_dataset, last_rejected_prices
+from instrumentation import span, span_stats, trace
+
+
+def format_brl(precos):
+    # Preço numérico -> texto de exibição ("R$ 1,234.56"); ausentes viram "N/A"
+    return precos.map(lambda x: f"R$ {x:,.2f}" if pd.notnull(x) else "N/A").astype(object)
+
+
+def format_pct(variacoes, sinal=True):
+    # Fração -> texto em % ("+1.5%", ou "1.5%" sem sinal); ausentes viram "N/A"
+    formato = "{:+.1f}%" if sinal else "{:.1f}%"
+    return variacoes.map(lambda x: formato.format(x * 100) if pd.notnull(x) else "N/A").astype(object)
+
+
+def indicator_table(indicadores, coluna_versao):
+    # Tabela de indicadores para exibição: ordenada por preço e formatada só no fim
+    tabela = indicadores.sort_values('Preço', ascending=False)
+    tabela = tabela[[coluna_versao, 'Mês', 'Preço', 'Var. Mensal', 'Var. Anual', 'Média Móvel', 'Volatilidade']]
+    tabela = tabela.rename(columns={coluna_versao: 'Versão'})
+    tabela['Mês'] = tabela['Mês'].dt.strftime('%d/%m/%Y')
+    for coluna in ('Preço', 'Média Móvel'):
+        tabela[coluna] = format_brl(tabela[coluna])
+    for coluna in ('Var. Mensal', 'Var. Anual'):
+        tabela[coluna] = format_pct(tabela[coluna])
+    tabela['Volatilidade'] = format_pct(tabela['Volatilidade'], sinal=False)
+    return tabela
+
+
+def index_frame(series):
+    # {rótulo: série mensal do índice} -> formato longo (Mês, Índice, Série) para o gráfico
+    partes = [pd.DataFrame({'Mês': serie.index, 'Índice': serie.to_numpy(), 'Série': rotulo})
+              for rotulo, serie in series.items() if serie is not None]
+    if not partes:
+        return pd.DataFrame(columns=['Mês', 'Índice', 'Série'])
+    return pd.concat(partes, ignore_index=True).dropna(subset=['Índice'])
+
+
+def apply_suggestions(semelhantes):
+    # Callback: roda antes da próxima execução, quando os multiselects ainda podem ser preenchidos
+    modelos = {}
+    for marca, modelo in semelhantes[['Marca', 'Modelo']].itertuples(index=False):
+        modelos.setdefault(marca, [])
+        if modelo not in modelos[marca]:
+            modelos[marca].append(modelo)
+    st.session_state["montadora_comp"] = list(modelos)
+    for marca, lista in modelos.items():
+        st.session_state[f"modelo_comp_{marca}"] = lista
+
+
+def show_chart(fig, nome):
+    # Envio do gráfico ao navegador, medido com o tamanho estimado dos dados das séries
+    with span(nome) as etapa:
+        etapa.bytes = figure_size(fig)
+        st.plotly_chart(fig, use_container_width=True)
 
-# Add this helper function at the top of the file, after imports
-def convert_price_string(price_str):
-    if pd.isna(price_str):
-        return None
-    # Remove all periods except the last one (which is the decimal separator)
-    if isinstance(price_str, str):
-        parts = price_str.split('.')
-        if len(parts) > 1:
-            integer_part = ''.join(parts[:-1])
-            decimal_part = parts[-1]
-            price_str = f"{integer_part}.{decimal_part}"
-    return float(price_str)
-
-# Modify the load_data function
-def load_data(file_path, sheet_name=None):
-    # Carregar os dados do Excel
-    df = pd.read_excel(file_path, sheet_name=sheet_name)
-    
-    # Convert price column if it exists
-    if 'PRECO' in df.columns:
-        df['PRECO'] = df['PRECO'].apply(convert_price_string)
-    
-    return df
-
-def create_excel_report(dados_historico, dados_comparativo=None):
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        dados_historico.to_excel(writer, sheet_name='Histórico de Preços', index=False)
-        if dados_comparativo is not None:
-            dados_comparativo.to_excel(writer, sheet_name='Comparativo', index=False)
-    return output.getvalue()
-
-def create_pdf_report(dados_historico, dados_comparativo=None):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Add title
-    elements.append(Paragraph("Relatório de Preços", styles['Heading1']))
-    elements.append(Spacer(1, 12))
-
-    # Add historical data table
-    elements.append(Paragraph("Histórico de Preços", styles['Heading2']))
-    hist_data = [dados_historico.columns.tolist()] + dados_historico.values.tolist()
-    hist_table = Table(hist_data)
-    hist_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 14),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(hist_table)
-
-    if dados_comparativo is not None:
-        elements.append(Spacer(1, 20))
-        elements.append(Paragraph("Dados Comparativos", styles['Heading2']))
-        comp_data = [dados_comparativo.columns.tolist()] + dados_comparativo.values.tolist()
-        comp_table = Table(comp_data)
-        comp_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 14),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(comp_table)
-
-    doc.build(elements)
-    return buffer.getvalue()
-
-def create_ppt_report(dados_historico, fig_historico, dados_comparativo=None, fig_comparativo=None):
+
+def session_id():
     try:
-        prs = Presentation()
-        
-        # Title slide
-        slide = prs.slides.add_slide(prs.slide_layouts[0])
-        title = slide.shapes.title
-        title.text = "Relatório de Análise de Preços"
-
-        # Historical data slide
-        slide = prs.slides.add_slide(prs.slide_layouts[5])
-        title = slide.shapes.title
-        title.text = "Histórico de Preços"
-        
-        # Save plot to temp file using a different approach
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, 'hist_plot.png')
-        
-        # Export figure with specific parameters
-        fig_historico.write_image(
-            temp_path, 
-            format='png',
-            engine='kaleido',
-            width=1000,
-            height=600,
-            scale=2
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        contexto = get_script_run_ctx()
+        return contexto.session_id if contexto is not None else None
+    except ImportError:
+        return None
+
+
+def performance_panel(execucao):
+    # Painel opcional na barra lateral: etapas desta execução e agregado do processo
+    with st.sidebar:
+        st.subheader("Desempenho")
+        st.caption(f"Esta execução: {execucao.total * 1000:.0f} ms")
+        st.dataframe(execucao.frame(), hide_index=True)
+        st.caption("Todas as sessões deste processo")
+        st.dataframe(span_stats.frame(), hide_index=True)
+        st.caption("Caches")
+        st.json({'datasets': dataset_store.stats(), 'figuras': figure_cache.stats(),
+                 'relatorios': report_jobs.stats()}, expanded=False)
+
+
+def report_download(formato, fingerprint, filtros, builder, rotulo, rotulo_download, nome_arquivo, mime,
+                    mensagem_erro):
+    # Botão que enfileira o relatório; o download aparece quando os bytes ficam prontos
+    chave = report_key(formato, fingerprint, filtros)
+    estado = f"relatorio_{formato}"
+
+    if st.button(rotulo, key=f"botao_{formato}"):
+        futuro = report_jobs.submit(chave if fingerprint is not None else None, builder)
+        st.session_state[estado] = (chave, futuro)
+
+    # Job desta sessão para os filtros atuais, ou um já gerado por outra sessão
+    salvo = st.session_state.get(estado)
+    if salvo is not None and salvo[0] == chave:
+        futuro = salvo[1]
+    elif fingerprint is not None:
+        futuro = report_jobs.get(chave)
+    else:
+        futuro = None
+    if futuro is None:
+        return
+
+    # Enquanto o job roda, só este trecho é reexecutado a cada segundo
+    em_andamento = not futuro.done()
+
+    @st.fragment(run_every=1 if em_andamento else None)
+    def status():
+        if not futuro.done():
+            st.info("⏳ Gerando relatório...")
+            return
+        if em_andamento:
+            # Pronto: reexecuta a página para parar a verificação periódica
+            st.rerun()
+        erro = futuro.exception()
+        if erro is not None:
+            st.error(f"{mensagem_erro}: {str(erro)}")
+            st.session_state.pop(estado, None)
+            return
+        st.download_button(
+            label=rotulo_download,
+            data=futuro.result(),
+            file_name=nome_arquivo,
+            mime=mime
         )
-        
-        slide.shapes.add_picture(temp_path, Inches(1), Inches(2), width=Inches(8))
 
-        if dados_comparativo is not None and fig_comparativo is not None:
-            slide = prs.slides.add_slide(prs.slide_layouts[5])
-            title = slide.shapes.title
-            title.text = "Análise Comparativa"
-            
-            comp_temp_path = os.path.join(temp_dir, 'comp_plot.png')
-            fig_comparativo.write_image(
-                comp_temp_path,
-                format='png',
-                engine='kaleido',
-                width=1000,
-                height=600,
-                scale=2
-            )
-            slide.shapes.add_picture(comp_temp_path, Inches(1), Inches(2), width=Inches(8))
+    status()
 
-        # Save to BytesIO
-        pptx_buffer = BytesIO()
-        prs.save(pptx_buffer)
-        
-        # Cleanup temporary files
-        import shutil
-        shutil.rmtree(temp_dir)
-        
-        return pptx_buffer.getvalue()
-        
-    except Exception as e:
-        st.error(f"Erro ao criar apresentação: {str(e)}")
-        return None
 
 def main():
+    # Cada execução da página é medida; o painel só aparece se habilitado na barra lateral
+    mostrar_painel = st.sidebar.checkbox("Mostrar painel de desempenho", key="painel_desempenho")
+    with trace(session_id()) as execucao:
+        render_page()
+    if mostrar_painel:
+        performance_panel(execucao)
+
+
+def render_page():
     try:
-        caminho_arquivo = 'https://github.com/ViniciusRamoss/Evolucao-de-preco/blob/main/Data.XLSM'  
+        # Arquivo local: permite validar o cache em disco pela impressão digital do arquivo
+        caminho_arquivo = 'Data.XLSM'
         aba_dados = 'Data'
         aba_precos = 'Preco'
 
-        # Carregar dados
-        base_dados = load_data(caminho_arquivo, aba_dados)
-        base_preco = load_data(caminho_arquivo, aba_precos)
-        base_preco = pd.melt(base_preco, id_vars=['ID', 'STATUS','CATEGORIA'], 
-                            var_name='MES', value_name='PRECO').dropna(subset=['PRECO'])
-        
-        dados_mesclados = pd.merge(base_dados, base_preco, on='ID', how='left')
+        # Carregar dados (cache Parquet invalidado quando a planilha muda)
+        with span('dataset') as etapa:
+            dataset = get_dataset(caminho_arquivo, aba_dados, aba_precos)
+            etapa.output(dataset.dados_mesclados)
+        dados_mesclados = dataset.dados_mesclados
         
         # Correção: st.logo para st.image
         st.image('images/logo-nissan.png')
@@ -185,121 +171,70 @@ def main():
         "dos preços de veículos. Nossa aplicação foi desenvolvida para transformar grandes volumes de " \
         "dados de planilhas em informações acionáveis, garantindo que você tenha uma visão clara da evolução " \
         "do mercado.")
+
+        # Células de preço que não puderam ser convertidas ficam de fora do histórico
+        precos_rejeitados = sum(last_rejected_prices.values())
+        if precos_rejeitados:
+            st.warning(f"{precos_rejeitados} célula(s) de preço inválida(s) foram ignoradas na planilha.")
         st.divider()
         
         #Filtragem de Categoria | Montadora | Modelo
         st.title("Histórico de Preço")
 
-        categorias_disponiveis = dados_mesclados['CATEGORIA'].dropna().unique()
+        # Índice Categoria → Marca → Modelo → Versão, montado uma vez por planilha
+        indice = dataset.selection_index
+
+        categorias_disponiveis = indice.categorias()
         selecao_categoria = st.selectbox("Categoria:", categorias_disponiveis, key="categoria_principal")
 
         col1, col2 = st.columns(2)
         with col1:
-            montadoras_disponiveis = dados_mesclados[dados_mesclados['CATEGORIA'] == selecao_categoria]['Marca'].unique()
+            montadoras_disponiveis = indice.marcas(selecao_categoria)
             montadora = st.selectbox("Montadora:", montadoras_disponiveis, key="montadora_principal")
         with col2:
-            modelos_disponiveis = dados_mesclados[(dados_mesclados['CATEGORIA'] == selecao_categoria) & 
-                                                 (dados_mesclados['Marca'] == montadora)]['Modelo'].unique()
+            modelos_disponiveis = indice.modelos(selecao_categoria, montadora)
             modelo = st.selectbox("Modelo:", modelos_disponiveis, key="modelo_principal")
             versoes_desativadas = st.checkbox("Incluir versões desativadas", key="checkbox_versoes")
 
-        if not versoes_desativadas:
-            dados_filtrados = dados_mesclados[(dados_mesclados['CATEGORIA'] == selecao_categoria) & 
-                                            (dados_mesclados['Marca'] == montadora) & 
-                                            (dados_mesclados['Modelo'] == modelo) & 
-                                            (dados_mesclados['STATUS'] == 'Ativo')]
-        else:
-            dados_filtrados = dados_mesclados[(dados_mesclados['CATEGORIA'] == selecao_categoria) & 
-                                            (dados_mesclados['Marca'] == montadora) & 
-                                            (dados_mesclados['Modelo'] == modelo)]
-
-        dados_filtrados = dados_filtrados[['ID', 'Marca', 'Modelo', 'Motor', 'Versão', 
-                                         'Combustível', 'Veículo', 'MES', 'PRECO']]
-        dados_filtrados = dados_filtrados.rename(columns={'MES': 'Mês', 'PRECO': 'Preço'})
+        with span('historico.filtro', len(dados_mesclados)) as etapa:
+            dados_filtrados = etapa.output(dataset.history(selecao_categoria, montadora, modelo,
+                                                           versoes_desativadas))
 
-        # Gráfico de linha para histórico de preços
+        # Gráfico de linha para histórico de preços (reaproveitado se a seleção não mudou)
         titulo_grafico = f"Histórico de Preço - {montadora} {modelo} ({selecao_categoria})"
-        fig = px.line(dados_filtrados,
-                      x='Mês',
-                      y='Preço',
-                      color="Versão",
-                      title=titulo_grafico,
-                      markers=True)
-        
-        fig.update_layout(
-            xaxis_title="Mês",
-            yaxis_title="Preço (R$)",
-            title_x=0.5,
-            legend_title="Versão",
-            hovermode="x unified",
-            legend=dict(
-                orientation="h", 
-                yanchor="top",   
-                y=-0.2,          
-                xanchor="center", 
-                x=0.5,           
-            )
-        )
+        chave_grafico = None
+        if dataset.key is not None:
+            chave_grafico = ('historico', dataset.key, selecao_categoria, montadora, modelo, versoes_desativadas)
+        with span('historico.grafico', len(dados_filtrados)):
+            fig = figure_cache.get_or_build(chave_grafico,
+                                            lambda: build_history_figure(dados_filtrados, titulo_grafico))
+
+        show_chart(fig, 'historico.envio')
+
+        # Últimos preços: fatia da visão materializada na carga, uma linha por versão
+        with span('ultimos_precos') as etapa:
+            ultimos_precos = etapa.output(dataset.latest(selecao_categoria, montadora, modelo))
+        if not versoes_desativadas:
+            ultimos_precos = ultimos_precos[ultimos_precos['STATUS'] == 'Ativo']
+        ultimos_precos = collapse_latest(ultimos_precos, 'Versão')
 
-        fig.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
-        fig.update_traces(
-            hovertemplate="<b>%{customdata[0]}</b><br>" +
-                          "Mês: %{x}<br>" +
-                          "Preço: R$ %{y:,.2f}<br><extra></extra>",
-            customdata=dados_filtrados[['Versão']]
-        )
+        # Ordenar por preço (numérico) em ordem decrescente; formatação só para exibição
+        tabela_precos = ultimos_precos.sort_values('PRECO', ascending=False)
+        tabela_precos = tabela_precos[['Modelo', 'Versão', 'Combustível', 'MES', 'PRECO', 'STATUS']]
+        tabela_precos = tabela_precos.rename(columns={'MES': 'Mês', 'PRECO': 'Preço'})
 
-        st.plotly_chart(fig, use_container_width=True)
-
-        # Converter Mês para datetime
-        dados_filtrados['Mês'] = pd.to_datetime(dados_filtrados['Mês'])
-        
-        # Obter últimos preços com valores não nulos
-        ultimos_precos = (dados_filtrados[dados_filtrados['Preço'].notna()]
-                         .sort_values('Mês')
-                         .groupby('Versão')
-                         .last()
-                         .reset_index())
-        
-        tabela_precos = ultimos_precos[['Modelo', 'Versão', 'Combustível', 'Mês', 'Preço']]
-        
-        # Adicionar informações de status se incluir versões desativadas
-        if versoes_desativadas:
-            tabela_precos = tabela_precos.merge(
-                dados_mesclados[['Versão', 'STATUS']].drop_duplicates(),
-                on='Versão',
-                how='left'
-            )
-            
-            # Formatar data como dd/mm/aaaa
-            tabela_precos['Data_Formatada'] = tabela_precos['Mês'].dt.strftime('%d/%m/%Y')
-            
-            # Adicionar informação de status na versão
-            tabela_precos['Versão'] = tabela_precos.apply(
-                lambda row: f"{row['Versão']} (Inativo - Último preço: {row['Data_Formatada']})" 
-                if row['STATUS'] == 'Inativo' else row['Versão'],
-                axis=1
-            )
-            
-            tabela_precos = tabela_precos.drop(['STATUS', 'Data_Formatada'], axis=1)
-        
         # Formatar data como dd/mm/aaaa
         tabela_precos['Mês'] = tabela_precos['Mês'].dt.strftime('%d/%m/%Y')
-        
-        # Formatar preço
-        tabela_precos['Preço'] = pd.to_numeric(tabela_precos['Preço'], errors='coerce')
-        tabela_precos['Preço'] = tabela_precos['Preço'].apply(lambda x: f"R$ {x:,.2f}" if pd.notnull(x) else "N/A")
-        
-        # Para a primeira tabela (Últimos Preços Registrados)
-        # Converter preço para numérico antes de ordenar
-        tabela_precos['Preço_Num'] = tabela_precos['Preço'].str.replace('R$ ', '').str.replace('.', '')\
-            .str.replace(',', '.').astype(float)
-        
-        # Ordenar por preço em ordem decrescente
-        tabela_precos = tabela_precos.sort_values('Preço_Num', ascending=False)
-        
-        # Remover coluna auxiliar usada para ordenação
-        tabela_precos = tabela_precos.drop('Preço_Num', axis=1)
+
+        # Adicionar informação de status na versão se incluir versões desativadas
+        versao = tabela_precos['Versão'].astype(object)
+        if versoes_desativadas:
+            inativo = tabela_precos['STATUS'] == 'Inativo'
+            versao = versao.where(~inativo, versao + ' (Inativo - Último preço: ' + tabela_precos['Mês'] + ')')
+        tabela_precos['Versão'] = versao
+
+        tabela_precos['Preço'] = format_brl(tabela_precos['Preço'])
+        tabela_precos = tabela_precos.drop('STATUS', axis=1)
 
         st.subheader("Últimos Preços Registrados")
         st.dataframe(
@@ -313,6 +248,37 @@ def main():
             },
             hide_index=True
         )
+
+        # Indicadores das versões do modelo, calculados sob demanda só para essas linhas (sem cache)
+        analise = dataset.analytics
+        with span('indicadores') as etapa:
+            indicadores = etapa.output(analise.indicators(
+                dataset.matrix.model_rows(selecao_categoria, montadora, modelo)))
+        if not versoes_desativadas:
+            indicadores = indicadores[indicadores['STATUS'] == 'Ativo']
+        indicadores = collapse_latest(indicadores, 'Versão', 'Mês')
+
+        st.subheader("Indicadores de Preço")
+        st.caption(f"Variação mensal e anual, média móvel e volatilidade ({analise.janela} meses) "
+                   "no último mês com preço de cada versão.")
+        st.dataframe(indicator_table(indicadores, 'Versão'), hide_index=True)
+
+        # Índices de preço (base 100) da categoria, da montadora e do modelo
+        chave_indices = None
+        if dataset.key is not None:
+            chave_indices = ('indices', dataset.key, selecao_categoria, montadora, modelo)
+        with span('indices.grafico'):
+            fig_indices = figure_cache.get_or_build(chave_indices, lambda: build_index_figure(
+                index_frame({
+                    f"Categoria {selecao_categoria}": analise.index_series(['CATEGORIA'], (selecao_categoria,)),
+                    f"{montadora} ({selecao_categoria})": analise.index_series(['CATEGORIA', 'Marca'],
+                                                                             (selecao_categoria, montadora)),
+                    f"{montadora} {modelo}": analise.index_series(['CATEGORIA', 'Marca', 'Modelo'],
+                                                                 (selecao_categoria, montadora, modelo)),
+                }),
+                f"Índice de Preços - {montadora} {modelo} ({selecao_categoria})"
+            ))
+        show_chart(fig_indices, 'indices.envio')
         st.divider()
 
         #Comparativo de preço
@@ -323,22 +289,56 @@ def main():
         modelo_referencia = modelo
         montadora_referencia = montadora
 
-        # Adicionar seletor de período
+        # Adicionar seletor de período (eixo de meses já convertido e ordenado na carga)
+        primeiro_mes = dataset.meses[0].date()
+        ultimo_mes = dataset.meses[-1].date()
         col1, col2 = st.columns(2)
         with col1:
             data_inicial = st.date_input(
                 "Data Inicial",
-                min_value=pd.to_datetime(dados_mesclados['MES']).min().date(),
-                max_value=pd.to_datetime(dados_mesclados['MES']).max().date(),
-                value=pd.to_datetime(dados_mesclados['MES']).min().date()
+                min_value=primeiro_mes,
+                max_value=ultimo_mes,
+                value=primeiro_mes
             )
         with col2:
             data_final = st.date_input(
                 "Data Final",
-                min_value=pd.to_datetime(dados_mesclados['MES']).min().date(),
-                max_value=pd.to_datetime(dados_mesclados['MES']).max().date(),
-                value=pd.to_datetime(dados_mesclados['MES']).max().date()
+                min_value=primeiro_mes,
+                max_value=ultimo_mes,
+                value=ultimo_mes
+            )
+
+        # Versões de outras montadoras/modelos com preço e trajetória parecidos no período
+        st.subheader("Veículos Semelhantes")
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            versao_referencia = st.selectbox(
+                "Versão de referência:",
+                ["Todas as versões"] + indice.versoes(selecao_categoria, montadora, modelo),
+                key="versao_semelhantes"
             )
+        with col2:
+            quantidade_semelhantes = st.number_input("Sugestões:", min_value=1, max_value=30, value=8,
+                                                     key="quantidade_semelhantes")
+        busca = dataset.similarity
+        with span('semelhantes') as etapa:
+            semelhantes = etapa.output(busca.similar(
+                selecao_categoria,
+                busca.reference_rows(selecao_categoria, montadora, modelo,
+                                     None if versao_referencia == "Todas as versões" else versao_referencia),
+                pd.to_datetime(data_inicial), pd.to_datetime(data_final), int(quantidade_semelhantes)
+            ))
+        if semelhantes.empty:
+            st.info("Sem preços suficientes da referência no período para sugerir veículos semelhantes.")
+        else:
+            st.caption("Ordenados pela distância entre o nível de preço e a trajetória no período.")
+            tabela_semelhantes = semelhantes[['Marca', 'Modelo', 'Versão', 'STATUS', 'Preço', 'Dif. Preço']].copy()
+            tabela_semelhantes['Preço'] = format_brl(tabela_semelhantes['Preço'])
+            tabela_semelhantes['Dif. Preço'] = format_pct(tabela_semelhantes['Dif. Preço'])
+            st.dataframe(tabela_semelhantes, hide_index=True,
+                         column_config={"Preço": "Último Preço", "Dif. Preço": "Dif. Nível de Preço"})
+            st.button("Usar sugestões na comparação", key="usar_semelhantes",
+                      on_click=apply_suggestions, args=(semelhantes,))
 
         # Multiselect para montadoras e modelos
         montadora_comparativo = st.multiselect(
@@ -352,10 +352,7 @@ def main():
         
         # Para cada montadora selecionada, mostrar seus modelos disponíveis
         for mont in montadora_comparativo:
-            modelos_disponiveis = dados_mesclados[
-                (dados_mesclados['CATEGORIA'] == selecao_categoria) & 
-                (dados_mesclados['Marca'] == mont)
-            ]['Modelo'].unique()
+            modelos_disponiveis = indice.modelos(selecao_categoria, mont)
             
             modelos_comp = st.multiselect(
                 f"Modelos da {mont}:",
@@ -368,118 +365,58 @@ def main():
         data_inicial = pd.to_datetime(data_inicial)
         data_final = pd.to_datetime(data_final)
 
-        # Filtrar dados de referência pelo período selecionado
-        dados_referencia = dados_mesclados[
-            (dados_mesclados['CATEGORIA'] == selecao_categoria) & 
-            (dados_mesclados['Marca'] == montadora_referencia) & 
-            (dados_mesclados['Modelo'] == modelo_referencia) &
-            (pd.to_datetime(dados_mesclados['MES']) >= data_inicial) &
-            (pd.to_datetime(dados_mesclados['MES']) <= data_final)
-        ]
+        # Referência e todos os modelos comparados extraídos de uma só vez no período
+        with span('comparativo.filtro', len(dados_mesclados)) as etapa:
+            comparacao = dataset.compare(selecao_categoria, (montadora_referencia, modelo_referencia),
+                                         modelos_selecionados, data_inicial, data_final)
+            etapa.output(comparacao.dados)
+        dados_referencia = comparacao.referencia
 
-        # Criar gráfico para cada modelo selecionado
+        # Criar gráfico para cada modelo selecionado (todos vão para o PowerPoint)
+        figs_comparativo = []
         for mont, modelo_comp in modelos_selecionados:
             # Dados do modelo de comparação
-            dados_comparativo = dados_mesclados[
-                (dados_mesclados['CATEGORIA'] == selecao_categoria) & 
-                (dados_mesclados['Marca'] == mont) & 
-                (dados_mesclados['Modelo'] == modelo_comp) &
-                (pd.to_datetime(dados_mesclados['MES']) >= data_inicial) &
-                (pd.to_datetime(dados_mesclados['MES']) <= data_final)
-            ]
+            dados_comparativo = comparacao.comparativos[(mont, modelo_comp)]
 
             # Combinar dados para o gráfico
             dados_combinados = pd.concat([
-                dados_referencia[['Marca', 'Modelo', 'Versão', 'MES', 'PRECO']],
-                dados_comparativo[['Marca', 'Modelo', 'Versão', 'MES', 'PRECO']]
+                dados_referencia[['Versão_Completa', 'MES', 'PRECO']],
+                dados_comparativo[['Versão_Completa', 'MES', 'PRECO']]
             ])
 
-            # Criar identificador único para cada versão
-            dados_combinados['Versão_Completa'] = dados_combinados['Marca'] + ' ' + \
-                                                 dados_combinados['Modelo'] + ' - ' + \
-                                                 dados_combinados['Versão']
-
             # Gráfico de comparação
             titulo_comparativo = f"Comparativo: {montadora_referencia} {modelo_referencia} vs {mont} {modelo_comp}"
-            fig_comp = px.line(
-                dados_combinados,
-                x='MES',
-                y='PRECO',
-                color='Versão_Completa',
-                title=titulo_comparativo,
-                markers=True
-            )
-
-            fig_comp.update_layout(
-                xaxis_title="Mês",
-                yaxis_title="Preço (R$)",
-                title_x=0.5,
-                legend_title="Versão",
-                hovermode="x unified",
-                legend=dict(
-                    orientation="h",
-                    yanchor="top",
-                    y=-0.2,
-                    xanchor="center",
-                    x=0.5
+            chave_comparativo = None
+            if dataset.key is not None:
+                chave_comparativo = ('comparativo', dataset.key, selecao_categoria,
+                                     (montadora_referencia, modelo_referencia), (mont, modelo_comp),
+                                     data_inicial, data_final)
+            with span('comparativo.grafico', len(dados_combinados)):
+                fig_comp = figure_cache.get_or_build(
+                    chave_comparativo,
+                    lambda: build_comparison_figure(dados_combinados, titulo_comparativo)
                 )
-            )
 
-            fig_comp.update_yaxes(tickprefix="R$ ", tickformat=",.2f")
-            fig_comp.update_traces(
-                hovertemplate="<b>%{customdata[0]}</b><br>" +
-                             "Mês: %{x}<br>" +
-                             "Preço: R$ %{y:,.2f}<br><extra></extra>",
-                customdata=dados_combinados[['Versão_Completa']]
-            )
-
-            st.plotly_chart(fig_comp, use_container_width=True)
+            show_chart(fig_comp, 'comparativo.envio')
+            figs_comparativo.append(fig_comp)
 
         # Tabela comparativa consolidada
         if modelos_selecionados:
-            # Lista para armazenar dados de todos os modelos
-            todos_dados = [dados_referencia]
-            
-            for mont, modelo_comp in modelos_selecionados:
-                dados_comp = dados_mesclados[
-                    (dados_mesclados['CATEGORIA'] == selecao_categoria) & 
-                    (dados_mesclados['Marca'] == mont) & 
-                    (dados_mesclados['Modelo'] == modelo_comp) &
-                    (pd.to_datetime(dados_mesclados['MES']) >= data_inicial) &
-                    (pd.to_datetime(dados_mesclados['MES']) <= data_final)
-                ]
-                todos_dados.append(dados_comp)
-
-            # Consolidar todos os dados
-            dados_consolidados = pd.concat(todos_dados)
-            dados_consolidados['Versão_Completa'] = dados_consolidados['Marca'] + ' ' + \
-                                                   dados_consolidados['Modelo'] + ' - ' + \
-                                                   dados_consolidados['Versão']
-
-            # Criar tabela de últimos preços
-            dados_consolidados['MES'] = pd.to_datetime(dados_consolidados['MES'])
-            ultimos_precos = dados_consolidados[dados_consolidados['PRECO'].notna()]\
-                .sort_values('MES')\
-                .groupby('Versão_Completa')\
-                .last()\
-                .reset_index()
-
-            tabela_comp = ultimos_precos[['Versão_Completa', 'MES', 'PRECO']]
+            # Ordenar por preço em ordem decrescente antes de formatar
+            tabela_comp = comparacao.ultimos.sort_values('PRECO', ascending=False)
+            tabela_comp = tabela_comp[['Versão_Completa', 'MES', 'PRECO']]
             tabela_comp = tabela_comp.rename(columns={
                 'Versão_Completa': 'Versão',
                 'MES': 'Mês',
                 'PRECO': 'Preço'
             })
 
+            # Valores numéricos preservados para os relatórios (formatos nativos no Excel)
+            relatorio_comp = tabela_comp.copy()
+
             # Formatação da tabela
             tabela_comp['Mês'] = tabela_comp['Mês'].dt.strftime('%d/%m/%Y')
-            tabela_comp['Preço'] = tabela_comp['Preço'].apply(lambda x: f"R$ {x:,.2f}")
-
-            # Ordenar por preço em ordem decrescente
-            tabela_comp['Preço_Num'] = tabela_comp['Preço'].str.replace('R$ ', '').str.replace('.', '')\
-                .str.replace(',', '.').astype(float)
-            tabela_comp = tabela_comp.sort_values('Preço_Num', ascending=False)
-            tabela_comp = tabela_comp.drop('Preço_Num', axis=1)
+            tabela_comp['Preço'] = format_brl(tabela_comp['Preço'])
 
             st.subheader("Últimos Preços Registrados - Comparativo")
             st.dataframe(
@@ -491,54 +428,81 @@ def main():
                     "Preço": "Último Preço"
                 }
             )
+
+            # Indicadores no fim do período e índices dos modelos rebaseados no início do período
+            modelos_comparados = [(montadora_referencia, modelo_referencia)] + modelos_selecionados
+            linhas = np.concatenate([np.arange(len(dataset.matrix.atributos))[
+                dataset.matrix.model_rows(selecao_categoria, mont, mod)] for mont, mod in modelos_comparados])
+            with span('comparativo.indicadores', len(linhas)) as etapa:
+                indicadores_comp = etapa.output(analise.indicators(linhas, data_final))
+            indicadores_comp = indicadores_comp[indicadores_comp['Mês'] >= data_inicial]
+            indicadores_comp['Versão_Completa'] = indicadores_comp['Marca'].astype(object) + ' ' + \
+                                                  indicadores_comp['Modelo'].astype(object) + ' - ' + \
+                                                  indicadores_comp['Versão'].astype(object)
+            indicadores_comp = collapse_latest(indicadores_comp, 'Versão_Completa', 'Mês')
+            st.subheader("Indicadores de Preço - Comparativo")
+            st.dataframe(indicator_table(indicadores_comp, 'Versão_Completa'), hide_index=True)
+
+            chave_indices_comp = None
+            if dataset.key is not None:
+                chave_indices_comp = ('indices_comparativo', dataset.key, selecao_categoria,
+                                      tuple(modelos_comparados), data_inicial, data_final)
+            indices_modelos = analise.segment_index(['CATEGORIA', 'Marca', 'Modelo'])
+            with span('comparativo.indices'):
+                fig_indices_comp = figure_cache.get_or_build(chave_indices_comp, lambda: build_index_figure(
+                    index_frame({
+                        f"{mont} {mod}": rebase(indices_modelos.loc[[(selecao_categoria, mont, mod)]],
+                                                data_inicial, data_final).iloc[0]
+                        for mont, mod in modelos_comparados
+                        if (selecao_categoria, mont, mod) in indices_modelos.index
+                    }),
+                    "Índice de Preços no Período (base 100)"
+                ))
+            show_chart(fig_indices_comp, 'comparativo.indices.envio')
         st.divider()
         #Parte de download de relatorios
         st.title("Download de Relatório")
         st.text("Gere relatórios personalizados com base nos filtros aplicados.")
 
+        # Relatórios gerados em segundo plano e reaproveitados para os mesmos filtros
+        filtros = (selecao_categoria, montadora, modelo, versoes_desativadas,
+                   tuple(modelos_selecionados), data_inicial, data_final)
+        dados_comp_relatorio = relatorio_comp if modelos_selecionados else None
+        figs_relatorio = figs_comparativo if modelos_selecionados else None
+        nome_arquivo = f"relatorio_precos_{selecao_categoria}_{modelo}"
+
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            if st.button("📥 Baixar Excel"):
-                excel_data = create_excel_report(
-                    dados_filtrados,
-                    tabela_comp if modelos_selecionados else None
-                )
-                st.download_button(
-                    label="📊 Clique para baixar Excel",
-                    data=excel_data,
-                    file_name=f"relatorio_precos_{selecao_categoria}_{modelo}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+            report_download(
+                'excel', dataset.key, filtros,
+                lambda: create_excel_report(dados_filtrados, dados_comp_relatorio, {
+                    'Matriz por Versão': dataset.version_matrix(selecao_categoria, montadora, modelo,
+                                                                versoes_desativadas)
+                }),
+                "📥 Baixar Excel", "📊 Clique para baixar Excel", f"{nome_arquivo}.xlsx",
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                "Erro ao criar planilha"
+            )
 
         with col2:
-            if st.button("📥 Baixar PDF"):
-                pdf_data = create_pdf_report(
-                    dados_filtrados,
-                    tabela_comp if modelos_selecionados else None
-                )
-                st.download_button(
-                    label="📄 Clique para baixar PDF",
-                    data=pdf_data,
-                    file_name=f"relatorio_precos_{selecao_categoria}_{modelo}.pdf",
-                    mime="application/pdf"
-                )
+            report_download(
+                'pdf', dataset.key, filtros,
+                lambda: create_pdf_report(dados_filtrados, dados_comp_relatorio),
+                "📥 Baixar PDF", "📄 Clique para baixar PDF", f"{nome_arquivo}.pdf",
+                "application/pdf",
+                "Erro ao criar PDF"
+            )
 
         with col3:
-            if st.button("📥 Baixar PowerPoint"):
-                ppt_data = create_ppt_report(
-                    dados_filtrados,
-                    fig,
-                    tabela_comp if modelos_selecionados else None,
-                    fig_comp if modelos_selecionados else None
-                )
-                st.download_button(
-                    label="📊 Clique para baixar PowerPoint",
-                    data=ppt_data,
-                    file_name=f"relatorio_precos_{selecao_categoria}_{modelo}.pptx",
-                    mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                )
-        
+            report_download(
+                'ppt', dataset.key, filtros,
+                lambda: create_ppt_report(dados_filtrados, fig, dados_comp_relatorio, figs_relatorio),
+                "📥 Baixar PowerPoint", "📊 Clique para baixar PowerPoint", f"{nome_arquivo}.pptx",
+                "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+                "Erro ao criar apresentação"
+            )
+
     except Exception as e:
         st.error(f"Erro ao carregar os dados: {str(e)}")
         return
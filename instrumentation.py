@@ -0,0 +1,206 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+# Logger das medições: uma linha JSON por etapa, para agregar entre sessões e processos
+logger = logging.getLogger('dashboard.performance')
+
+# Arquivo de log JSON (uma linha por etapa) habilitado por variável de ambiente
+LOG_ENV_VAR = 'DASHBOARD_PERF_LOG'
+
+# Execução (rerun) em andamento na thread/contexto atual, e a pilha de etapas abertas
+_trace_atual = contextvars.ContextVar('trace_atual', default=None)
+
+_PAGINA = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def _rss():
+    # Memória residente do processo (bytes); None fora do Linux
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGINA
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _rows(objeto):
+    # Linhas de um DataFrame/array/lista; None para o que não tem tamanho
+    try:
+        return len(objeto)
+    except TypeError:
+        return None
+
+
+class Span:
+    """Uma etapa medida: tempo, linhas de entrada/saída, bytes produzidos e variação de memória."""
+
+    __slots__ = ('nome', 'nivel', 'inicio', 'segundos', 'linhas_entrada', 'linhas_saida', 'bytes',
+                 'memoria_delta', 'erro')
+
+    def __init__(self, nome, nivel=0, linhas_entrada=None):
+        self.nome = nome
+        self.nivel = nivel
+        self.inicio = None
+        self.segundos = None
+        self.linhas_entrada = linhas_entrada
+        self.linhas_saida = None
+        self.bytes = None
+        self.memoria_delta = None
+        self.erro = None
+
+    def output(self, objeto):
+        """Registra as linhas de saída a partir do resultado e o devolve (uso em expressões)."""
+        self.linhas_saida = _rows(objeto)
+        return objeto
+
+    def as_dict(self):
+        return {atributo: getattr(self, atributo) for atributo in self.__slots__}
+
+
+class Trace:
+    """Etapas de uma execução da página (um rerun), na ordem em que terminaram."""
+
+    def __init__(self, sessao=None):
+        self.sessao = sessao
+        self.inicio = time.perf_counter()
+        self.spans = []
+        self._nivel = 0
+
+    def frame(self):
+        """Tabela das etapas para exibição (ms, linhas, KB e MB)."""
+        linhas = [{
+            'Etapa': '  ' * span.nivel + span.nome,
+            'Início (ms)': round(span.inicio * 1000, 1),
+            'Tempo (ms)': round(span.segundos * 1000, 1),
+            'Linhas entrada': span.linhas_entrada,
+            'Linhas saída': span.linhas_saida,
+            'KB': None if span.bytes is None else round(span.bytes / 1024, 1),
+            'Memória Δ (MB)': None if span.memoria_delta is None else round(span.memoria_delta / 2 ** 20, 1),
+        } for span in sorted(self.spans, key=lambda s: s.inicio)]
+        tabela = pd.DataFrame(linhas, columns=['Etapa', 'Início (ms)', 'Tempo (ms)', 'Linhas entrada',
+                                               'Linhas saída', 'KB', 'Memória Δ (MB)'])
+        return tabela.astype({'Linhas entrada': 'Int64', 'Linhas saída': 'Int64'})
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.inicio
+
+
+class SpanStats:
+    """Agregado das etapas de todas as sessões do processo (contagem, total, máximo)."""
+
+    def __init__(self):
+        self._etapas = {}
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            contagem, total, maximo = self._etapas.get(span.nome, (0, 0.0, 0.0))
+            self._etapas[span.nome] = (contagem + 1, total + span.segundos, max(maximo, span.segundos))
+
+    def frame(self):
+        with self._lock:
+            itens = sorted(self._etapas.items())
+        return pd.DataFrame([{
+            'Etapa': nome,
+            'Execuções': contagem,
+            'Média (ms)': round(total / contagem * 1000, 1),
+            'Máximo (ms)': round(maximo * 1000, 1),
+            'Total (s)': round(total, 2),
+        } for nome, (contagem, total, maximo) in itens],
+            columns=['Etapa', 'Execuções', 'Média (ms)', 'Máximo (ms)', 'Total (s)'])
+
+    def clear(self):
+        with self._lock:
+            self._etapas.clear()
+
+
+span_stats = SpanStats()
+
+
+@contextmanager
+def trace(sessao=None):
+    """Abre a execução em que as etapas seguintes (neste contexto) são registradas."""
+    atual = Trace(sessao)
+    token = _trace_atual.set(atual)
+    try:
+        yield atual
+    finally:
+        _trace_atual.reset(token)
+
+
+@contextmanager
+def span(nome, linhas_entrada=None):
+    """Mede uma etapa. Fora de uma execução (ex.: relatório em segundo plano) só vai
+    para o agregado e o log."""
+    atual = _trace_atual.get()
+    medida = Span(nome, atual._nivel if atual is not None else 0, linhas_entrada)
+    memoria = _rss()
+    inicio = time.perf_counter()
+    if atual is not None:
+        atual._nivel += 1
+    try:
+        yield medida
+    except BaseException as e:
+        medida.erro = type(e).__name__
+        raise
+    finally:
+        medida.segundos = time.perf_counter() - inicio
+        if atual is not None:
+            atual._nivel -= 1
+            medida.inicio = inicio - atual.inicio
+            atual.spans.append(medida)
+        else:
+            medida.inicio = 0.0
+        depois = _rss()
+        if memoria is not None and depois is not None:
+            medida.memoria_delta = depois - memoria
+        span_stats.record(medida)
+        if logger.isEnabledFor(logging.INFO):
+            registro = medida.as_dict()
+            registro['data'] = time.time()
+            registro['sessao'] = atual.sessao if atual is not None else None
+            registro['pid'] = os.getpid()
+            logger.info(json.dumps(registro, ensure_ascii=False, default=str))
+
+
+def traced(nome):
+    """Decorador: mede a função como uma etapa; linhas de entrada = tamanho do 1º argumento
+    e, se o resultado for bytes (relatórios), o tamanho gerado."""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with span(nome, _rows(args[0]) if args else None) as etapa:
+                resultado = funcao(*args, **kwargs)
+                if isinstance(resultado, (bytes, bytearray)):
+                    etapa.bytes = len(resultado)
+                else:
+                    etapa.output(resultado)
+                return resultado
+        return medida
+    return decorador
+
+
+def configure_logging(caminho=None):
+    """Grava as etapas em JSON (uma por linha) no arquivo de DASHBOARD_PERF_LOG, se definido."""
+    caminho = caminho or os.environ.get(LOG_ENV_VAR)
+    if not caminho or any(getattr(h, '_perf_log', None) == caminho for h in logger.handlers):
+        return
+    handler = logging.FileHandler(caminho, encoding='utf-8')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler._perf_log = caminho
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # As linhas JSON não se misturam ao log do Streamlit
+    logger.propagate = False
+
+
+configure_logging()
@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+
+
+class BoundedLRU:
+    """Dicionário LRU limitado por quantidade de entradas e por tamanho total (bytes).
+
+    Seguro entre threads; conta acertos, faltas e descartes. Entradas cujo valor não
+    passa em `evictable` (ex.: jobs ainda em andamento) nunca são descartadas nem
+    removidas por clear(), e os limites são respeitados só com as demais.
+    """
+
+    def __init__(self, max_entries, max_bytes, evictable=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._evictable = evictable
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, count=True):
+        # Valor guardado (marcado como o mais recente) ou None; count=False não mexe nos contadores
+        with self._lock:
+            item = self._itens.get(key)
+            if item is not None:
+                self._itens.move_to_end(key)
+            if count:
+                if item is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return None if item is None else item[0]
+
+    def get_or_add(self, key, factory):
+        """(valor, criado): o valor guardado, ou o de factory() guardado agora com tamanho 0.
+
+        factory roda dentro do lock, então deve ser rápida (ex.: só enfileirar um job).
+        """
+        with self._lock:
+            item = self._itens.get(key)
+            if item is not None:
+                self._itens.move_to_end(key)
+                self.hits += 1
+                return item[0], False
+            self.misses += 1
+            valor = factory()
+            self._itens[key] = (valor, 0)
+            self._evict()
+            return valor, True
+
+    def add(self, key, value, size=0):
+        # Guarda o valor se a chave ainda não existe; um valor maior que o limite nem entra
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key not in self._itens:
+                self._itens[key] = (value, size)
+                self._bytes += size
+                self._evict()
+
+    def resize(self, key, value, size):
+        # Novo tamanho de `value` (ex.: job concluído); ignorado se a chave já guarda outro valor
+        with self._lock:
+            item = self._itens.get(key)
+            if item is None or item[0] is not value:
+                return
+            self._itens[key] = (value, size)
+            self._bytes += size - item[1]
+            self._evict()
+
+    def discard(self, key, value):
+        # Remove a chave se ela ainda guarda `value` (ex.: job que falhou, para ser refeito)
+        with self._lock:
+            item = self._itens.get(key)
+            if item is not None and item[0] is value:
+                del self._itens[key]
+                self._bytes -= item[1]
+
+    def _can_evict(self, valor):
+        return self._evictable is None or self._evictable(valor)
+
+    def _evict(self):
+        # Remove as entradas descartáveis menos usadas até respeitar os dois limites
+        if len(self._itens) <= self.max_entries and self._bytes <= self.max_bytes:
+            return
+        for key in list(self._itens):
+            if len(self._itens) <= self.max_entries and self._bytes <= self.max_bytes:
+                break
+            valor, tamanho = self._itens[key]
+            if self._can_evict(valor):
+                del self._itens[key]
+                self._bytes -= tamanho
+                self.evictions += 1
+
+    def values(self):
+        with self._lock:
+            return [valor for valor, _ in self._itens.values()]
+
+    def clear(self):
+        with self._lock:
+            for key in [key for key, (valor, _) in self._itens.items() if self._can_evict(valor)]:
+                self._bytes -= self._itens.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._itens),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
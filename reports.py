@@ -0,0 +1,499 @@
+import asyncio
+import atexit
+import functools
+import hashlib
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+import xlsxwriter
+from pptx import Presentation
+from pptx.util import Inches
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Paragraph
+from reportlab.lib.styles import getSampleStyleSheet
+
+from instrumentation import traced
+from lru import BoundedLRU
+
+
+# Parâmetros das imagens dos gráficos nos slides
+IMAGE_WIDTH = 1000
+IMAGE_HEIGHT = 600
+IMAGE_SCALE = 2
+
+# Formatos nativos do Excel para as colunas de preço e de mês
+EXCEL_PRICE_FORMAT = '"R$" #,##0.00'
+EXCEL_DATE_FORMAT = 'dd/mm/yyyy'
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+# Linhas usadas para estimar a largura das colunas e largura máxima (caracteres)
+EXCEL_WIDTH_SAMPLE = 200
+EXCEL_MAX_WIDTH = 60
+
+# Layout das tabelas do PDF: página, margens, fonte e altura fixa de linha
+PDF_PAGE_SIZE = letter
+PDF_MARGIN = 54
+PDF_FONT = 'Helvetica'
+PDF_HEADER_FONT = 'Helvetica-Bold'
+PDF_FONT_SIZE = 8
+PDF_ROW_HEIGHT = 14
+PDF_CELL_PADDING = 3
+# Linhas usadas para estimar a largura das colunas
+PDF_WIDTH_SAMPLE = 200
+
+# Colunas formatadas como moeda no PDF
+PRICE_COLUMNS = ('Preço', 'PRECO')
+
+# Figuras renderizadas em paralelo (abas do Chrome no kaleido>=1, threads no kaleido 0.2)
+RENDER_WORKERS = 4
+
+# Relatórios gerados ao mesmo tempo em segundo plano
+REPORT_WORKERS = 2
+
+
+def _excel_serial(datas):
+    # Datas como número de série do Excel: escrito como número + formato de data,
+    # sem criar um datetime por célula
+    return ((datas - EXCEL_EPOCH) / pd.Timedelta(days=1)).to_numpy()
+
+
+def _excel_column(serie, coluna, formatos):
+    # Valores da coluna prontos para escrita, o método de escrita e o formato nativo
+    if pd.api.types.is_datetime64_any_dtype(serie.dtype):
+        return _excel_serial(serie), 'write_number', formatos['data']
+    if pd.api.types.is_numeric_dtype(serie.dtype) and not pd.api.types.is_bool_dtype(serie.dtype):
+        # Colunas de mês da matriz versão × mês também guardam preços
+        preco = str(coluna) in PRICE_COLUMNS or isinstance(coluna, (pd.Timestamp, datetime, date))
+        valores = serie.to_numpy(dtype='float64')
+        if preco:
+            # Preços float32 voltam ao valor exato em centavos
+            return valores.round(2), 'write_number', formatos['preco']
+        return valores, 'write_number', None
+    valores = serie.astype(object).where(serie.notna(), None).to_numpy()
+    return valores, 'write_string', None
+
+
+def _write_excel_sheet(workbook, nome, df, formatos):
+    worksheet = workbook.add_worksheet(nome)
+
+    # Cabeçalho (os meses da matriz também viram datas nativas)
+    for posicao, coluna in enumerate(df.columns):
+        if isinstance(coluna, (pd.Timestamp, datetime, date)):
+            serial = (pd.Timestamp(coluna) - EXCEL_EPOCH) / pd.Timedelta(days=1)
+            worksheet.write_number(0, posicao, serial, formatos['cabecalho_data'])
+        else:
+            worksheet.write_string(0, posicao, str(coluna), formatos['cabecalho'])
+
+    colunas = [_excel_column(df[coluna], coluna, formatos) for coluna in df.columns]
+    escritas = [(posicao, getattr(worksheet, metodo), formato)
+                for posicao, (_, metodo, formato) in enumerate(colunas)]
+
+    # Escrita linha a linha: no modo constant_memory cada linha vai direto para o
+    # disco assim que a seguinte começa; células vazias são simplesmente puladas
+    for linha, valores in enumerate(zip(*(valores for valores, _, _ in colunas)), start=1):
+        for (posicao, escrever, formato), valor in zip(escritas, valores):
+            if valor is None or valor != valor:
+                continue
+            escrever(linha, posicao, valor, formato)
+
+    for posicao, (valores, metodo, formato) in enumerate(colunas):
+        worksheet.set_column(posicao, posicao, _excel_width(df.columns[posicao], valores, metodo, formato))
+    worksheet.freeze_panes(1, 0)
+    if len(df.columns):
+        worksheet.autofilter(0, 0, len(df), len(df.columns) - 1)
+
+
+def _excel_width(coluna, valores, metodo, formato):
+    # Largura aproximada em caracteres, estimada pelo cabeçalho e por uma amostra
+    if formato is not None:
+        return max(len(str(coluna)), 16) + 2
+    amostra = valores[:EXCEL_WIDTH_SAMPLE]
+    if metodo == 'write_string':
+        textos = [len(valor) for valor in amostra if valor is not None]
+    else:
+        textos = [len(f"{valor:g}") for valor in amostra if valor == valor]
+    return min(max([len(str(coluna))] + textos) + 2, EXCEL_MAX_WIDTH)
+
+
+@traced('relatorio.excel')
+def create_excel_report(dados_historico, dados_comparativo=None, planilhas_extras=None):
+    """Relatório Excel em modo constant_memory: as linhas são gravadas em disco à
+    medida que são escritas, com formatos nativos de moeda e data.
+
+    planilhas_extras: dicionário opcional {nome da aba: DataFrame} (ex.: PriceDataset.version_matrix).
+    """
+    planilhas = {'Histórico de Preços': dados_historico}
+    if dados_comparativo is not None:
+        planilhas['Comparativo'] = dados_comparativo
+    planilhas.update(planilhas_extras or {})
+
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    formatos = {
+        'cabecalho': workbook.add_format({'bold': True, 'bg_color': '#D9D9D9', 'border': 1}),
+        'cabecalho_data': workbook.add_format({'bold': True, 'bg_color': '#D9D9D9', 'border': 1,
+                                               'num_format': EXCEL_DATE_FORMAT}),
+        'data': workbook.add_format({'num_format': EXCEL_DATE_FORMAT}),
+        'preco': workbook.add_format({'num_format': EXCEL_PRICE_FORMAT}),
+    }
+    try:
+        for nome, df in planilhas.items():
+            _write_excel_sheet(workbook, nome, df, formatos)
+    finally:
+        workbook.close()
+    return output.getvalue()
+
+
+def _format_pdf_cell(valor, coluna):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return ''
+    if isinstance(valor, (pd.Timestamp, datetime, date)):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, (float, np.floating)):
+        return f"R$ {valor:,.2f}" if coluna in PRICE_COLUMNS else f"{valor:g}"
+    return str(valor)
+
+
+def _pdf_rows(df):
+    # Linhas já formatadas como texto, geradas sob demanda (sem montar a lista inteira)
+    colunas = list(df.columns)
+    for linha in df.itertuples(index=False, name=None):
+        yield [_format_pdf_cell(valor, coluna) for valor, coluna in zip(linha, colunas)]
+
+
+def _pdf_column_widths(df, largura_total):
+    # Larguras fixas a partir do cabeçalho e de uma amostra das linhas
+    amostra = list(itertools.islice(_pdf_rows(df), PDF_WIDTH_SAMPLE))
+    larguras = []
+    for posicao, coluna in enumerate(df.columns):
+        largura = max([_text_width(str(coluna), PDF_HEADER_FONT)] +
+                      [_text_width(linha[posicao]) for linha in amostra])
+        larguras.append(largura + 2 * PDF_CELL_PADDING)
+    if sum(larguras) <= largura_total:
+        escala = largura_total / sum(larguras)
+        return [largura * escala for largura in larguras]
+
+    # Colunas estreitas (ID, datas, preços) mantêm a largura natural; só as
+    # mais largas dividem o espaço que sobra e têm o texto cortado
+    restantes = set(range(len(larguras)))
+    espaco = largura_total
+    while True:
+        cota = espaco / len(restantes)
+        estreitas = {i for i in restantes if larguras[i] <= cota}
+        if not estreitas:
+            break
+        restantes -= estreitas
+        espaco -= sum(larguras[i] for i in estreitas)
+    return [cota if i in restantes else largura for i, largura in enumerate(larguras)]
+
+
+@functools.lru_cache(maxsize=65536)
+def _text_width(texto, fonte=PDF_FONT):
+    # Marcas, modelos e versões se repetem em todas as linhas: mede cada texto uma vez
+    return stringWidth(texto, fonte, PDF_FONT_SIZE)
+
+
+@functools.lru_cache(maxsize=65536)
+def _fit_text(texto, largura, fonte=PDF_FONT):
+    # Corta o texto que não cabe na coluna, para nenhuma célula invadir a vizinha
+    limite = largura - 2 * PDF_CELL_PADDING
+    if _text_width(texto, fonte) <= limite:
+        return texto
+    # Busca binária pelo maior prefixo que cabe junto com as reticências
+    menor, maior = 0, len(texto)
+    while menor < maior:
+        meio = (menor + maior + 1) // 2
+        if stringWidth(texto[:meio] + '…', fonte, PDF_FONT_SIZE) <= limite:
+            menor = meio
+        else:
+            maior = meio - 1
+    return texto[:menor] + '…'
+
+
+class _PdfWriter:
+    """Desenha o relatório página a página direto no canvas.
+
+    Cada página recebe seu bloco de linhas com o cabeçalho repetido, larguras de
+    coluna fixas e altura de linha constante: nada precisa ser medido no layout
+    e só uma página de linhas fica em memória por vez.
+    """
+
+    def __init__(self, buffer):
+        self.canvas = Canvas(buffer, pagesize=PDF_PAGE_SIZE, pageCompression=1)
+        self.largura, self.altura = PDF_PAGE_SIZE
+        self.largura_util = self.largura - 2 * PDF_MARGIN
+        self.estilos = getSampleStyleSheet()
+        self.pagina = 1
+        self.y = self.altura - PDF_MARGIN
+
+    def new_page(self):
+        self._draw_page_number()
+        self.canvas.showPage()
+        self.pagina += 1
+        self.y = self.altura - PDF_MARGIN
+
+    def _draw_page_number(self):
+        self.canvas.setFont(PDF_FONT, PDF_FONT_SIZE)
+        self.canvas.setFillColor(colors.black)
+        self.canvas.drawCentredString(self.largura / 2, PDF_MARGIN / 2, f"Página {self.pagina}")
+
+    def paragraph(self, texto, estilo, espaco=0):
+        paragrafo = Paragraph(texto, self.estilos[estilo])
+        _, altura = paragrafo.wrapOn(self.canvas, self.largura_util, self.altura)
+        if self.y - altura < PDF_MARGIN:
+            self.new_page()
+        paragrafo.drawOn(self.canvas, PDF_MARGIN, self.y - altura)
+        self.y -= altura + espaco
+
+    def spacer(self, altura):
+        self.y -= altura
+
+    def _draw_text_row(self, texto, celulas, bordas, y, fonte):
+        # Texto centralizado em cada célula, numa única sequência de operadores
+        texto.setFont(fonte, PDF_FONT_SIZE)
+        for celula, esquerda, direita in zip(celulas, bordas, bordas[1:]):
+            texto.setTextOrigin((esquerda + direita - _text_width(celula, fonte)) / 2, y)
+            texto.textOut(celula)
+
+    def _draw_block(self, cabecalho, bloco, bordas):
+        canvas = self.canvas
+        topo = self.y
+        linhas_y = [topo - k * PDF_ROW_HEIGHT for k in range(len(bloco) + 2)]
+        # Deslocamento da linha de base para centralizar o texto na linha da tabela
+        base = (PDF_ROW_HEIGHT - PDF_FONT_SIZE) / 2 + 1.5
+
+        canvas.setFillColor(colors.grey)
+        canvas.rect(bordas[0], linhas_y[1], bordas[-1] - bordas[0], PDF_ROW_HEIGHT, stroke=0, fill=1)
+
+        texto = canvas.beginText()
+        texto.setFillColor(colors.whitesmoke)
+        self._draw_text_row(texto, cabecalho, bordas, linhas_y[1] + base, PDF_HEADER_FONT)
+        texto.setFillColor(colors.black)
+        for linha, y in zip(bloco, linhas_y[2:]):
+            self._draw_text_row(texto, linha, bordas, y + base, PDF_FONT)
+        canvas.drawText(texto)
+
+        canvas.setStrokeColor(colors.black)
+        canvas.setLineWidth(0.5)
+        canvas.grid(bordas, linhas_y)
+        self.y = linhas_y[-1]
+
+    def table(self, df):
+        larguras = _pdf_column_widths(df, self.largura_util)
+        bordas = list(itertools.accumulate([PDF_MARGIN] + larguras))
+        cabecalho = [_fit_text(str(coluna), largura, PDF_HEADER_FONT) for coluna, largura in zip(df.columns, larguras)]
+        linhas = _pdf_rows(df)
+        # Uma linha lida à frente: só abre página nova se ainda houver linhas, e o
+        # cabeçalho é desenhado mesmo sem nenhuma
+        pendente = list(itertools.islice(linhas, 1))
+
+        while True:
+            # Quantas linhas (além do cabeçalho) cabem no espaço restante da página
+            cabem = int((self.y - PDF_MARGIN) // PDF_ROW_HEIGHT) - 1
+            if cabem < 1:
+                self.new_page()
+                continue
+
+            bloco = pendente + list(itertools.islice(linhas, cabem - len(pendente)))
+            pendente = list(itertools.islice(linhas, 1))
+            bloco = [[_fit_text(texto, largura) for texto, largura in zip(linha, larguras)] for linha in bloco]
+            self._draw_block(cabecalho, bloco, bordas)
+
+            if not pendente:
+                break
+            self.new_page()
+
+    def close(self):
+        self._draw_page_number()
+        self.canvas.save()
+
+
+@traced('relatorio.pdf')
+def create_pdf_report(dados_historico, dados_comparativo=None):
+    buffer = BytesIO()
+    pdf = _PdfWriter(buffer)
+
+    # Add title
+    pdf.paragraph("Relatório de Preços", 'Heading1', espaco=12)
+
+    # Add historical data table
+    pdf.paragraph("Histórico de Preços", 'Heading2', espaco=6)
+    pdf.table(dados_historico)
+
+    if dados_comparativo is not None:
+        pdf.spacer(20)
+        pdf.paragraph("Dados Comparativos", 'Heading2', espaco=6)
+        pdf.table(dados_comparativo)
+
+    pdf.close()
+    return buffer.getvalue()
+
+
+class ImageRenderer:
+    """Renderizador PNG mantido aberto entre exportações.
+
+    Com kaleido>=1 um único Chrome com `workers` abas roda num event loop próprio
+    e as figuras são renderizadas em paralelo. Sem ele (kaleido 0.2, ou Chrome
+    que não abriu) as figuras passam uma a uma por plotly.io.to_image, e a
+    abertura do Chrome é tentada de novo na exportação seguinte. As imagens
+    voltam como bytes, sem passar por arquivos temporários.
+    """
+
+    def __init__(self, workers=RENDER_WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._loop = None
+        self._kaleido = None
+
+    def _start(self):
+        try:
+            from kaleido import Kaleido
+        except ImportError:
+            return
+
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name='kaleido-renderer', daemon=True).start()
+        try:
+            self._kaleido = asyncio.run_coroutine_threadsafe(self._open(Kaleido), loop).result()
+            self._loop = loop
+        except Exception:
+            # Sem Chrome disponível: esta exportação segue pelo plotly.io, que reporta o erro
+            loop.call_soon_threadsafe(loop.stop)
+
+    async def _open(self, Kaleido):
+        kaleido = Kaleido(n=self.workers)
+        await kaleido.open()
+        return kaleido
+
+    def render(self, figs, width=IMAGE_WIDTH, height=IMAGE_HEIGHT, scale=IMAGE_SCALE):
+        """PNGs (bytes) das figuras, na mesma ordem."""
+        with self._lock:
+            if self._loop is None:
+                self._start()
+            loop = self._loop
+
+        if loop is not None:
+            opts = {'format': 'png', 'width': width, 'height': height, 'scale': scale}
+            futuros = [asyncio.run_coroutine_threadsafe(self._kaleido.calc_fig(fig.to_dict(), opts), loop)
+                       for fig in figs]
+            return [futuro.result() for futuro in futuros]
+
+        # kaleido 0.2 serializa as figuras num único subprocesso e o kaleido>=1 abriria
+        # um Chrome por chamada: em sequência, sem pool de threads
+        return [pio.to_image(fig, format='png', width=width, height=height, scale=scale) for fig in figs]
+
+    def close(self):
+        with self._lock:
+            if self._loop is not None:
+                asyncio.run_coroutine_threadsafe(self._kaleido.close(), self._loop).result()
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+                self._kaleido = None
+
+
+# Renderizador do processo, aberto na primeira exportação e reaproveitado depois
+image_renderer = ImageRenderer()
+atexit.register(image_renderer.close)
+
+
+@traced('relatorio.ppt')
+def create_ppt_report(dados_historico, fig_historico, dados_comparativo=None, fig_comparativo=None):
+    # fig_comparativo: uma figura ou a lista com todos os gráficos comparativos
+    if fig_comparativo is None or dados_comparativo is None:
+        figs_comparativo = []
+    elif isinstance(fig_comparativo, (list, tuple)):
+        figs_comparativo = list(fig_comparativo)
+    else:
+        figs_comparativo = [fig_comparativo]
+
+    # Todas as imagens de uma vez, renderizadas em paralelo
+    imagens = image_renderer.render([fig_historico] + figs_comparativo)
+
+    prs = Presentation()
+
+    # Title slide
+    slide = prs.slides.add_slide(prs.slide_layouts[0])
+    title = slide.shapes.title
+    title.text = "Relatório de Análise de Preços"
+
+    # Historical data slide
+    slide = prs.slides.add_slide(prs.slide_layouts[5])
+    title = slide.shapes.title
+    title.text = "Histórico de Preços"
+    slide.shapes.add_picture(BytesIO(imagens[0]), Inches(1), Inches(2), width=Inches(8))
+
+    # Um slide por gráfico comparativo
+    for posicao, imagem in enumerate(imagens[1:], start=1):
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        title = slide.shapes.title
+        title.text = "Análise Comparativa"
+        if len(figs_comparativo) > 1:
+            title.text += f" ({posicao}/{len(figs_comparativo)})"
+        slide.shapes.add_picture(BytesIO(imagem), Inches(1), Inches(2), width=Inches(8))
+
+    # Save to BytesIO
+    pptx_buffer = BytesIO()
+    prs.save(pptx_buffer)
+    return pptx_buffer.getvalue()
+
+
+def report_key(formato, fingerprint, filtros):
+    # Chave curta e estável (formato, filtros, impressão digital da planilha)
+    return hashlib.sha256(repr((formato, fingerprint, filtros)).encode('utf-8')).hexdigest()
+
+
+class ReportJobs:
+    """Geração de relatórios em segundo plano, com os resultados em cache LRU.
+
+    Pedidos com a mesma chave reaproveitam o job em andamento ou os bytes já
+    prontos, inclusive entre sessões. Só jobs concluídos são descartados ao
+    exceder os limites; jobs com erro saem do cache para poderem ser refeitos.
+    """
+
+    def __init__(self, workers=REPORT_WORKERS, max_entries=32, max_bytes=256 * 1024 * 1024):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reports')
+        # Tamanho de cada job = bytes do relatório, conhecido só ao concluir
+        self._jobs = BoundedLRU(max_entries, max_bytes, evictable=lambda futuro: futuro.done())
+
+    def get(self, key):
+        return self._jobs.get(key, count=False)
+
+    def submit(self, key, builder):
+        # key=None: gera sem guardar (ex.: planilha remota, sem impressão digital)
+        if key is None:
+            return self._pool.submit(builder)
+
+        futuro, novo = self._jobs.get_or_add(key, lambda: self._pool.submit(builder))
+        if novo:
+            futuro.add_done_callback(functools.partial(self._finished, key))
+        return futuro
+
+    def _finished(self, key, futuro):
+        if futuro.cancelled() or futuro.exception() is not None:
+            self._jobs.discard(key, futuro)
+        else:
+            self._jobs.resize(key, futuro, len(futuro.result()))
+
+    def clear(self):
+        self._jobs.clear()
+
+    def stats(self):
+        stats = self._jobs.stats()
+        stats['running'] = sum(not futuro.done() for futuro in self._jobs.values())
+        return stats
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Fila de relatórios do processo, compartilhada por todas as sessões do dashboard
+report_jobs = ReportJobs()
+atexit.register(report_jobs.close)
@@ -0,0 +1,132 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# Peso do nível de preço em relação à forma da trajetória na distância
+LEVEL_WEIGHT = 1.0
+
+# Meses com preço no período para a versão entrar na busca
+MIN_MONTHS = 2
+
+# Períodos/categorias com vetores já montados, reaproveitados entre consultas
+FEATURE_CACHE_SIZE = 32
+
+
+def _fill_gaps(valores):
+    # Preenche os meses sem preço com o último anterior (ou o primeiro seguinte), sem laço por linha
+    colunas = np.arange(valores.shape[1], dtype='int32')
+    preenchido = ~np.isnan(valores)
+    linhas = np.arange(len(valores))[:, None]
+
+    anterior = np.maximum.accumulate(np.where(preenchido, colunas, -1), axis=1)
+    seguinte = np.minimum.accumulate(np.where(preenchido, colunas, valores.shape[1])[:, ::-1], axis=1)[:, ::-1]
+    origem = np.where(anterior >= 0, anterior, np.minimum(seguinte, valores.shape[1] - 1))
+    return valores[linhas, origem]
+
+
+class SimilarityIndex:
+    """Busca de versões parecidas por nível e trajetória de preço, sobre a matriz séries × meses.
+
+    Cada série vira um vetor no período: o log do preço médio (nível) e o desvio
+    do log do preço em relação a esse nível, mês a mês (trajetória). A distância
+    euclidiana entre vetores compara as duas coisas em variação relativa de preço.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+        valores = matrix.valores
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_precos = np.where(valores > 0, np.log(valores, dtype='float32'), np.float32(np.nan))
+        # Pré-calculado uma vez: log dos preços com lacunas preenchidas e contagem acumulada.
+        # float32/int16 bastam para distâncias e contagens de meses, com metade da memória
+        self._log = _fill_gaps(log_precos)
+        self._contagem = np.zeros((len(valores), valores.shape[1] + 1), dtype='int16')
+        np.cumsum(~np.isnan(log_precos), axis=1, out=self._contagem[:, 1:])
+
+        self._categorias = {categoria: np.asarray(linhas) for categoria, linhas in
+                            matrix.atributos.groupby('CATEGORIA', sort=False, observed=True).indices.items()}
+        # Código de Marca/Modelo por série, para tirar o próprio modelo da busca
+        self._modelo = matrix.atributos.groupby(['Marca', 'Modelo'], sort=False, dropna=False,
+                                                observed=True).ngroup().to_numpy()
+        self._vetores = OrderedDict()
+        self._lock = threading.Lock()
+
+    def features(self, categoria, data_inicial=None, data_final=None):
+        """(linhas, vetores) das séries da categoria com preço suficiente no período."""
+        janela = self.matrix.month_window(data_inicial, data_final)
+        chave = (categoria, janela.start, janela.stop)
+        with self._lock:
+            if chave in self._vetores:
+                self._vetores.move_to_end(chave)
+                return self._vetores[chave]
+
+        linhas = self._categorias.get(categoria, np.empty(0, dtype='int64'))
+        meses = janela.stop - janela.start
+        quantidade = self._contagem[linhas, janela.stop] - self._contagem[linhas, janela.start]
+        linhas = linhas[quantidade >= min(MIN_MONTHS, max(meses, 1))]
+
+        bloco = self._log[linhas, janela]
+        nivel = bloco.mean(axis=1, dtype='float64') if meses else np.zeros(len(linhas))
+        trajetoria = (bloco - nivel[:, None]) / np.sqrt(max(meses, 1))
+        vetores = np.column_stack([np.sqrt(LEVEL_WEIGHT) * nivel, trajetoria]).astype('float32')
+
+        with self._lock:
+            self._vetores[chave] = (linhas, vetores)
+            while len(self._vetores) > FEATURE_CACHE_SIZE:
+                self._vetores.popitem(last=False)
+        return linhas, vetores
+
+    def reference_rows(self, categoria, marca, modelo, versao=None):
+        """Linhas da matriz do modelo, ou só das séries de uma versão."""
+        linhas = np.arange(len(self.matrix.atributos))[self.matrix.model_rows(categoria, marca, modelo)]
+        if versao is not None:
+            linhas = linhas[self.matrix.atributos['Versão'].to_numpy()[linhas] == versao]
+        return linhas
+
+    def similar(self, categoria, referencia, data_inicial=None, data_final=None, n=10):
+        """Versões mais parecidas com `referencia` (linhas da matriz) na categoria, das outras montadoras/modelos.
+
+        A referência de várias versões (um modelo inteiro) é o centroide dos vetores.
+        Retorna Marca, Modelo, Versão, STATUS, último preço no período, diferença de nível e distância.
+        """
+        linhas, vetores = self.features(categoria, data_inicial, data_final)
+        referencia = np.arange(len(self.matrix.atributos))[referencia]
+        e_referencia = np.isin(linhas, referencia)
+        if not e_referencia.any():
+            return pd.DataFrame(columns=['Marca', 'Modelo', 'Versão', 'STATUS', 'Preço', 'Dif. Preço', 'Distância'])
+
+        centro = vetores[e_referencia].mean(axis=0)
+        distancias = np.sqrt(((vetores - centro) ** 2).sum(axis=1))
+
+        # Fora da busca: o próprio modelo de referência
+        distancias[np.isin(self._modelo[linhas], self._modelo[referencia])] = np.inf
+        candidatos = np.flatnonzero(np.isfinite(distancias))
+
+        # Só os k mais próximos são ordenados; k cresce se as repetições de versão
+        # (IDs ativo/inativo) deixarem menos de n versões distintas
+        k = max(4 * n, 64)
+        while True:
+            if k < len(candidatos):
+                ordem = candidatos[np.argpartition(distancias[candidatos], k)[:k]]
+            else:
+                ordem = candidatos
+            ordem = ordem[np.argsort(distancias[ordem], kind='stable')]
+            resultado = self.matrix.atributos.iloc[linhas[ordem]][['Marca', 'Modelo', 'Versão', 'STATUS']]
+            unicas = ~resultado.duplicated(['Marca', 'Modelo', 'Versão']).to_numpy()
+            if unicas.sum() >= n or k >= len(candidatos):
+                break
+            k *= 4
+
+        ordem = ordem[unicas][:n]
+        resultado = resultado[unicas].head(n).reset_index(drop=True)
+        # Último preço no período, da matriz (o log em float32 não guarda os centavos)
+        janela = self.matrix.month_window(data_inicial, data_final)
+        bloco = self.matrix.valores[linhas[ordem], janela]
+        ultimo = bloco.shape[1] - 1 - (~np.isnan(bloco))[:, ::-1].argmax(axis=1)
+        resultado['Preço'] = bloco[np.arange(len(bloco)), ultimo].astype('float64')
+        resultado['Dif. Preço'] = np.exp((vetores[ordem, 0] - centro[0]) / np.sqrt(LEVEL_WEIGHT)) - 1
+        resultado['Distância'] = distancias[ordem]
+        return resultado
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from charts import lttb
+
+
+@pytest.mark.parametrize('n, limite', [(10, 10), (10, 50), (10, 2), (0, 5)])
+def test_lttb_keeps_short_series(n, limite):
+    np.testing.assert_array_equal(lttb(np.arange(n), np.arange(n), limite), np.arange(n))
+
+
+@pytest.mark.parametrize('n, limite', [(1000, 100), (101, 3), (500, 499), (37, 10)])
+def test_lttb_one_point_per_bucket(n, limite):
+    rng = np.random.default_rng(n)
+    indices = lttb(np.arange(n), rng.normal(size=n).cumsum(), limite)
+    assert len(indices) == limite
+    assert indices[0] == 0 and indices[-1] == n - 1
+    # Um ponto por bloco: estritamente crescentes, cada um dentro do seu bloco
+    bordas = np.linspace(1, n - 1, limite - 1).astype('int64')
+    assert np.all((indices[1:-1] >= bordas[:-1]) & (indices[1:-1] < bordas[1:]))
+
+
+def test_lttb_keeps_peaks_and_steps():
+    # Série plana com um pico isolado e um degrau: os dois pontos precisam sobreviver
+    y = np.full(1000, 100.0)
+    y[437] = 250.0
+    y[800:] = 150.0
+    x = np.arange(1000, dtype='float64')
+    indices = lttb(x, y, 50)
+    assert 437 in indices
+    assert np.any(y[indices] == 150.0) and np.any(y[indices[indices < 800]] == 100.0)
+
+
+def test_lttb_uneven_x():
+    # Eixo de datas com meses faltando: usa as distâncias reais do eixo
+    x = np.cumsum(np.r_[0, np.random.default_rng(1).integers(28, 62, 299)]).astype('float64')
+    y = np.sin(x / 200)
+    indices = lttb(x, y, 30)
+    assert len(indices) == 30 and np.all(np.diff(indices) > 0)
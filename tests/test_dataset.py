@@ -0,0 +1,112 @@
+import re
+import zipfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import dataset
+from benchmark import generate_workbook
+
+
+ABAS = ['Data', 'Preco']
+
+
+def test_read_workbook_ignores_stale_dimension(tmp_path):
+    # Ferramentas que gravam <dimension ref="A1"/> em toda aba: o modo somente leitura do
+    # openpyxl confiaria nessa dimensão e devolveria uma única célula
+    origem = tmp_path / 'origem.xlsx'
+    generate_workbook(str(origem), versoes=20, meses=6, semente=1)
+    openpyxl.load_workbook(origem).save(origem)
+    caminho = tmp_path / 'dimensao.xlsx'
+    with zipfile.ZipFile(origem) as entrada, zipfile.ZipFile(caminho, 'w', zipfile.ZIP_DEFLATED) as saida:
+        for item in entrada.infolist():
+            conteudo = entrada.read(item)
+            if item.filename.startswith('xl/worksheets/'):
+                conteudo = re.sub(rb'<dimension ref="[^"]*"\s*/>', b'<dimension ref="A1"/>', conteudo)
+            saida.writestr(item, conteudo)
+
+    esperadas, _ = dataset.read_workbook(str(origem), ABAS)
+    obtidas, _ = dataset.read_workbook(str(caminho), ABAS)
+    for aba in ABAS:
+        assert obtidas[aba].shape == (20, esperadas[aba].shape[1])
+        pd.testing.assert_frame_equal(obtidas[aba], esperadas[aba])
+
+
+@pytest.mark.parametrize('texto, esperado', [
+    ('1.234,56', 1234.56),
+    ('R$ 1.234,56', 1234.56),
+    ('R$ 123.990,00', 123990.0),
+    ('1.234.56', 1234.56),
+    # Só pontos: o último é o decimal, como em convert_price_string
+    ('R$ 123.990', 123.99),
+    ('R$ 1.234.567', 1234.567),
+    ('99990', 99990.0),
+])
+def test_normalize_prices_text(texto, esperado):
+    precos, rejeitados = dataset.normalize_prices([texto])
+    assert precos.iloc[0] == pytest.approx(esperado)
+    assert rejeitados == 0
+
+
+def test_normalize_prices_matches_convert_price_string():
+    textos = ['1.234.56', '123.990', '1.234.567', '99990', '120990.5', '1.000.000.00']
+    precos, _ = dataset.normalize_prices(textos)
+    assert precos.tolist() == [dataset.convert_price_string(texto) for texto in textos]
+
+
+def test_normalize_prices_counts_only_invalid_cells():
+    precos, rejeitados = dataset.normalize_prices(['abc', None, '1.234,56', 'abc', np.nan, 10])
+    assert rejeitados == 2
+    assert precos.isna().tolist() == [True, True, False, True, True, False]
+    assert precos.dtype == np.float64
+
+
+def test_normalize_prices_numeric_column():
+    precos, rejeitados = dataset.normalize_prices(pd.Series([1, 2.5, np.nan]))
+    assert precos.dtype == np.float64
+    assert precos.iloc[:2].tolist() == [1.0, 2.5]
+    assert rejeitados == 0
+
+
+@pytest.fixture
+def price_dataset():
+    # IDs repetidos na aba Data, IDs sem nenhum preço e buracos no histórico
+    rng = np.random.default_rng(7)
+    ids = np.arange(1, 31, dtype='float64')
+    base_dados = pd.DataFrame({'ID': np.concatenate([ids, [3.0, 17.0, 40.0]]), 'Marca': 'MARCA'})
+    meses = pd.date_range('2024-01-01', periods=12, freq='MS')
+    largura = pd.DataFrame({'ID': ids, 'STATUS': 'Ativo', 'CATEGORIA': 'SUV'})
+    for mes in meses:
+        largura[mes] = np.where(rng.random(len(ids)) < 0.3, np.nan, rng.integers(50, 200, len(ids)) * 1000.0)
+    base_preco, dados_mesclados = dataset.merge_price_history(base_dados, largura)
+    return dataset.PriceDataset(base_dados, base_preco, dados_mesclados)
+
+
+@pytest.mark.parametrize('data_inicial, data_final', [
+    ('2024-03-01', '2024-08-01'),
+    ('2024-03-15', '2024-08-15'),
+    ('2023-01-01', '2030-01-01'),
+    ('2024-06-01', '2024-06-01'),
+    ('2024-08-01', '2024-03-01'),
+    ('2026-01-01', '2026-12-01'),
+])
+def test_period_positions_matches_mask(price_dataset, data_inicial, data_final):
+    mes = price_dataset.dados_mesclados['MES']
+    no_periodo = ((mes >= pd.Timestamp(data_inicial)) & (mes <= pd.Timestamp(data_final))).to_numpy()
+    rng = np.random.default_rng(11)
+    todas = np.arange(len(mes))
+    for posicoes in (todas, np.sort(rng.choice(todas, 40, replace=False)), todas[:0]):
+        obtidas = price_dataset.period_positions(posicoes, data_inicial, data_final)
+        np.testing.assert_array_equal(obtidas, posicoes[no_periodo[posicoes]])
+
+
+def test_period_positions_keeps_only_selected_duplicate_rows(price_dataset):
+    # As duas linhas do ID 3 na aba Data dividem o bloco; só as da linha escolhida voltam
+    mesclados = price_dataset.dados_mesclados
+    do_id = np.flatnonzero((mesclados['ID'] == 3).to_numpy())
+    metade = do_id[mesclados['MES'].to_numpy()[do_id].argsort(kind='stable')][::2]
+    posicoes = np.sort(metade)
+    obtidas = price_dataset.period_positions(posicoes, '2024-01-01', '2024-12-01')
+    np.testing.assert_array_equal(obtidas, posicoes[mesclados['MES'].notna().to_numpy()[posicoes]])
@@ -0,0 +1,142 @@
+import shutil
+import time
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import dataset
+from benchmark import generate_workbook
+
+
+ABAS = ('Data', 'Preco')
+
+
+@pytest.fixture
+def planilha(tmp_path):
+    # Planilha sintética regravada pelo openpyxl: as versões alteradas abaixo saem do
+    # mesmo gravador, então uma aba não tocada mantém a assinatura no zip
+    origem = tmp_path / 'origem.xlsx'
+    generate_workbook(str(origem), versoes=120, meses=30, semente=3)
+    caminho = tmp_path / 'Data.xlsx'
+    openpyxl.load_workbook(origem).save(caminho)
+    return caminho
+
+
+def edit_workbook(caminho, edicao):
+    workbook = openpyxl.load_workbook(caminho)
+    edicao(workbook)
+    workbook.save(caminho)
+
+
+def assert_same_as_full_load(caminho):
+    incremental = dataset.load_dataset(str(caminho), *ABAS)
+    assert dataset.last_ingest['mode'] == 'incremental'
+    completa = dataset.load_dataset(str(caminho), *ABAS, use_cache=False)
+    for obtido, esperado in zip(incremental, completa):
+        pd.testing.assert_frame_equal(obtido, esperado)
+
+    # O cache regravado pela carga incremental também bate com a carga completa
+    dataset.load_dataset(str(caminho), *ABAS)
+    assert dataset.last_ingest['mode'] == 'cache'
+    for obtido, esperado in zip(dataset.load_dataset(str(caminho), *ABAS), completa):
+        pd.testing.assert_frame_equal(obtido, esperado)
+
+
+def changed_price(workbook):
+    aba = workbook['Preco']
+    for linha in aba.iter_rows(min_row=2, min_col=4):
+        celulas = [celula for celula in linha if isinstance(celula.value, (int, float))]
+        if celulas:
+            celulas[-1].value += 1000
+            return
+
+
+def new_month(workbook):
+    aba = workbook['Preco']
+    coluna = aba.max_column + 1
+    ultimo = aba.cell(row=1, column=coluna - 1).value
+    aba.cell(row=1, column=coluna, value=(pd.Timestamp(ultimo) + pd.DateOffset(months=1)).to_pydatetime())
+    for linha in range(2, aba.max_row + 1, 3):
+        aba.cell(row=linha, column=coluna, value=99990.0)
+
+
+def removed_month(workbook):
+    aba = workbook['Preco']
+    aba.delete_cols(aba.max_column)
+
+
+def renamed_version(workbook):
+    aba = workbook['Data']
+    aba.cell(row=7, column=5, value='VERSAO RENOMEADA')
+
+
+def new_version(workbook):
+    dados, preco = workbook['Data'], workbook['Preco']
+    novo = dados.max_row
+    dados.append([novo, 'MARCA NOVA', 'MODELO NOVO', 2.0, 'VERSAO NOVA', 'Flex', 'MARCA NOVA MODELO NOVO',
+                  None, None, novo])
+    preco.append([novo, 'Ativo', preco.cell(row=2, column=3).value] +
+                 [None] * (preco.max_column - 5) + [120990.0, 121990.0])
+
+
+def repeated_id(workbook):
+    # Mesmo ID ativo e inativo, como na planilha real
+    dados, preco = workbook['Data'], workbook['Preco']
+    dados.append([cell.value for cell in dados[2]])
+    preco.append([preco.cell(row=2, column=1).value, 'Inativo', preco.cell(row=2, column=3).value] +
+                 [110990.0] * (preco.max_column - 3))
+
+
+def other_sheet(workbook):
+    # Arquivo alterado sem tocar nas abas Data e Preco
+    workbook.create_sheet('Notas')['A1'] = 1
+
+
+@pytest.mark.parametrize('edicao', [changed_price, new_month, removed_month, renamed_version, new_version,
+                                    repeated_id, other_sheet])
+def test_incremental_matches_full_load(planilha, edicao):
+    dataset.load_dataset(str(planilha), *ABAS)
+    assert dataset.last_ingest['mode'] == 'completa'
+
+    edit_workbook(planilha, edicao)
+    assert_same_as_full_load(planilha)
+
+
+def test_consecutive_updates(planilha):
+    dataset.load_dataset(str(planilha), *ABAS)
+    for edicao in (new_month, repeated_id, changed_price, renamed_version):
+        edit_workbook(planilha, edicao)
+        assert_same_as_full_load(planilha)
+
+
+def test_incremental_is_faster_than_full_reload(tmp_path):
+    # Um mês novo só refaz o ano dele: depois da leitura da aba, a carga incremental tem de
+    # custar menos que recarregar tudo (as duas gravam o cache). Melhor de 3, cada incremental
+    # partindo do mesmo cache anterior
+    origem = tmp_path / 'origem.xlsx'
+    generate_workbook(str(origem), versoes=1500, meses=120, semente=3)
+    caminho = tmp_path / 'Data.xlsx'
+    openpyxl.load_workbook(origem).save(caminho)
+    dataset.load_dataset(str(caminho), *ABAS)
+    cache = tmp_path / dataset.CACHE_DIR
+    anterior = tmp_path / 'cache_anterior'
+    shutil.copytree(cache, anterior)
+    edit_workbook(caminho, new_month)
+
+    def depois_da_leitura(modo):
+        inicio = time.perf_counter()
+        dataset.load_dataset(str(caminho), *ABAS)
+        decorrido = time.perf_counter() - inicio
+        assert dataset.last_ingest['mode'] == modo
+        leitura = sum(dataset.last_parse_timings.get(etapa, 0) for etapa in ('open', *ABAS, 'normalize'))
+        return decorrido - leitura
+
+    incremental, completa = [], []
+    for _ in range(3):
+        shutil.rmtree(cache)
+        shutil.copytree(anterior, cache)
+        incremental.append(depois_da_leitura('incremental'))
+        shutil.rmtree(cache)
+        completa.append(depois_da_leitura('completa'))
+    assert min(incremental) < min(completa)
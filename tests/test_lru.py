@@ -0,0 +1,57 @@
+from concurrent.futures import Future
+
+from lru import BoundedLRU
+
+
+def test_evicts_least_recently_used_by_entries_and_bytes():
+    cache = BoundedLRU(max_entries=3, max_bytes=100)
+    for chave in 'abc':
+        cache.add(chave, chave.upper(), 10)
+    assert cache.get('a') == 'A'
+    cache.add('d', 'D', 10)
+    assert cache.get('b') is None
+
+    # 110 bytes: sai só a menos usada ('c'), o que já respeita os dois limites
+    cache.add('e', 'E', 80)
+    assert cache.get('c') is None
+    assert [cache.get(chave) for chave in 'ade'] == ['A', 'D', 'E']
+    assert cache.stats() == {'entries': 3, 'bytes': 100, 'hits': 4, 'misses': 2, 'evictions': 2}
+
+
+def test_value_larger_than_limit_is_not_stored():
+    cache = BoundedLRU(max_entries=3, max_bytes=100)
+    cache.add('a', 'A', 10)
+    cache.add('grande', 'G', 101)
+    assert cache.get('grande') is None and cache.get('a') == 'A'
+
+
+def test_pending_entries_are_kept_until_resized():
+    # Como os jobs de relatório: só os concluídos podem sair, com o tamanho conhecido ao concluir
+    cache = BoundedLRU(max_entries=1, max_bytes=100, evictable=lambda futuro: futuro.done())
+    primeiro, criado = cache.get_or_add('a', Future)
+    assert criado
+    segundo, _ = cache.get_or_add('b', Future)
+    assert cache.get_or_add('a', Future) == (primeiro, False)
+    # Acima do limite, mas sem nenhum job concluído para descartar
+    assert cache.stats()['entries'] == 2
+
+    primeiro.set_result(b'x' * 60)
+    cache.resize('a', primeiro, 60)
+    assert cache.values() == [segundo]
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] == 0
+    cache.clear()
+    assert cache.values() == [segundo]
+
+    segundo.set_exception(RuntimeError())
+    cache.discard('b', segundo)
+    assert cache.stats()['entries'] == 0
+
+
+def test_resize_and_discard_ignore_replaced_values():
+    cache = BoundedLRU(max_entries=5, max_bytes=100)
+    antigo, novo = object(), object()
+    cache.add('a', novo, 10)
+    cache.resize('a', antigo, 50)
+    cache.discard('a', antigo)
+    assert cache.get('a') is novo
+    assert cache.stats()['bytes'] == 10
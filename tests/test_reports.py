@@ -0,0 +1,38 @@
+import io
+import re
+
+import pandas as pd
+import pytest
+
+import reports
+
+
+def draw_table(linhas):
+    buffer = io.BytesIO()
+    writer = reports._PdfWriter(buffer)
+    writer.table(pd.DataFrame({'Versão': [f"VERSAO {n}" for n in range(linhas)], 'Preço': [99990.0] * linhas}))
+    writer.close()
+    return buffer.getvalue()
+
+
+def page_count(pdf):
+    return len(re.findall(rb'/Type /Page\b(?!s)', pdf))
+
+
+def rows_per_page():
+    # Linhas que cabem abaixo do cabeçalho numa página vazia
+    writer = reports._PdfWriter(io.BytesIO())
+    return int((writer.y - reports.PDF_MARGIN) // reports.PDF_ROW_HEIGHT) - 1
+
+
+@pytest.mark.parametrize('paginas_cheias', [1, 2])
+def test_table_filling_pages_exactly_adds_no_blank_page(paginas_cheias):
+    cabem = rows_per_page()
+    assert page_count(draw_table(cabem * paginas_cheias)) == paginas_cheias
+    assert page_count(draw_table(cabem * paginas_cheias + 1)) == paginas_cheias + 1
+
+
+def test_empty_table_draws_header():
+    pdf = draw_table(0)
+    assert page_count(pdf) == 1
+    assert reports.PDF_HEADER_FONT.encode() in pdf